@@ -0,0 +1,548 @@
+import json
+import pickle
+import platform
+import random
+import sys
+import tracemalloc
+from heapq import heappop, heappush
+from math import inf
+from timeit import default_timer as time
+
+import numpy as np
+
+import nm_pathfinder
+from nm_contraction import build_contraction, contraction_search
+from nm_hierarchy import build_hierarchy, hierarchical_search
+from nm_mesh import build_components, build_index, build_landmarks, compact_mesh, views
+from nm_meshbuilder import build_mesh
+from nm_stats import SearchStats
+
+
+def scan_boxes(point, mesh):
+    # Reference point location: the original linear scan over every box
+    for box in mesh["boxes"]:
+        if (box[0] <= point[0] <= box[1]) and (box[2] <= point[1] <= box[3]):
+            return box
+    return None
+
+
+def random_points(mesh, count, seed=0):
+    # Uniform points over the mesh bounding rectangle, walkable or not
+    rng = random.Random(seed)
+    boxes = mesh["boxes"]
+    x0, x1 = min(box[0] for box in boxes), max(box[1] for box in boxes)
+    y0, y1 = min(box[2] for box in boxes), max(box[3] for box in boxes)
+    return [(rng.randint(x0, x1), rng.randint(y0, y1)) for _ in range(count)]
+
+
+def benchmark_locate(mesh, count=10000, seed=0):
+    """ Times the linear scan against the grid index for point location.
+
+    Args:
+        mesh:   The navmesh to query.
+        count:  Number of random query points.
+        seed:   Seed for the query points.
+
+    Returns:    A dict of timings in seconds.
+
+    """
+    points = random_points(mesh, count, seed)
+
+    start = time()
+    index = build_index(mesh)
+    build = time() - start
+
+    start = time()
+    expected = [scan_boxes(point, mesh) for point in points]
+    scan = time() - start
+
+    start = time()
+    single = [nm_pathfinder.get_boxes(point, mesh) for point in points]
+    indexed = time() - start
+
+    start = time()
+    bulk = nm_pathfinder.locate_points(points, mesh)
+    located = time() - start
+
+    if single != expected or bulk != expected:
+        raise AssertionError("grid index disagrees with the linear scan")
+
+    return {
+        "points": count,
+        "cells": index["rows"] * index["cols"],
+        "build": build,
+        "scan": scan,
+        "get_boxes": indexed,
+        "locate_points": located,
+    }
+
+
+def random_box_pairs(mesh, count, seed=0):
+    # Reproducible (source box id, destination box id) pairs
+    rng = random.Random(seed)
+    n = len(mesh["boxes"])
+    return [(rng.randrange(n), rng.randrange(n)) for _ in range(count)]
+
+
+def random_point_pairs(mesh, count, seed=0):
+    # Reproducible (source, destination) pairs of walkable points: a box picked
+    # in proportion to its area, then a uniform point inside it
+    rng = random.Random(seed)
+    boxes = list(mesh["boxes"])
+    weights = [(box[1] - box[0]) * (box[3] - box[2]) for box in boxes]
+
+    def point():
+        box = rng.choices(boxes, weights)[0]
+        return (rng.randint(box[0], box[1]), rng.randint(box[2], box[3]))
+
+    return [(point(), point()) for _ in range(count)]
+
+
+def corridor_cost(mesh, parent_dict, start, goal):
+    # Total edge cost along a search's parent table from goal back to start, or None
+    corridor = nm_pathfinder._corridor(parent_dict, start, goal)
+    if corridor is None:
+        return None
+    v = views(mesh)
+    total = 0
+    for a, b in zip(corridor, corridor[1:]):
+        for e in range(v["offsets"][a], v["offsets"][a + 1]):
+            if v["neighbors"][e] == b:
+                total += v["costs"][e]
+                break
+    return total
+
+
+def benchmark_heuristics(mesh, count=500, landmarks=8, seed=0):
+    """ Compares boxes expanded by A* and bidirectional A* with the straight-line and ALT heuristics.
+
+    Args:
+        mesh:       The navmesh to query.
+        count:      Number of random box pairs.
+        landmarks:  Number of ALT landmarks to build.
+        seed:       Seed for the box pairs.
+
+    Returns:    A dict of {search: {heuristic: totals}}.
+
+    """
+    start = time()
+    build_landmarks(mesh, landmarks)
+    build = time() - start
+
+    pairs = random_box_pairs(mesh, count, seed)
+    searches = (("a_star", nm_pathfinder._a_star), ("a_star_bi", nm_pathfinder._a_star_bi))
+
+    result = {"pairs": count, "landmarks": landmarks, "build": build}
+    for name, search in searches:
+        result[name] = {}
+        for heuristic in ("euclidean", "alt"):
+            stats = SearchStats()
+            found = 0
+            cost = 0.0
+            start = time()
+            for source, destination in pairs:
+                cost_found = corridor_cost(mesh, search(mesh, source, destination, heuristic, stats), source, destination)
+                if cost_found is not None:
+                    found += 1
+                    cost += cost_found
+            result[name][heuristic] = {"expanded": stats.expanded, "found": found,
+                                       "cost": cost, "time": time() - start}
+    return result
+
+
+def benchmark_contraction(mesh, count=1000, seed=0):
+    """ Times contraction hierarchy queries against a_star_bi on random walkable point pairs.
+
+    Args:
+        mesh:   The navmesh to query.
+        count:  Number of random point pairs.
+        seed:   Seed for the point pairs.
+
+    Returns:    A dict of build time, per-query times and total path costs.
+
+    """
+    start = time()
+    contraction = build_contraction(mesh)
+    build = time() - start
+
+    pairs = random_point_pairs(mesh, count, seed)
+    located = nm_pathfinder._locate_all(mesh, [point for pair in pairs for point in pair])
+    boxes = list(zip(located[0::2], located[1::2]))
+
+    result = {"pairs": count, "build": build, "shortcuts": int((contraction["middle"] != -1).sum())}
+    for name in ("a_star_bi", "contraction"):
+        times = []
+        cost = 0.0
+        found = 0
+        for source, destination in boxes:
+            start = time()
+            if name == "contraction":
+                corridor = contraction_search(mesh, source, destination)
+                parent_dict = None if corridor is None else dict(zip(corridor[1:], corridor))
+            else:
+                parent_dict = nm_pathfinder._a_star_bi(mesh, source, destination)
+            times.append(time() - start)
+            path_cost = corridor_cost(mesh, parent_dict, source, destination)
+            if path_cost is not None:
+                found += 1
+                cost += path_cost
+        times.sort()
+        result[name] = {"mean": sum(times) / len(times), "p50": times[len(times) // 2],
+                        "max": times[-1], "found": found, "cost": cost}
+    return result
+
+
+def alternating_a_star_bi(mesh, start, goal, heuristic="euclidean", stats=None):
+    # Reference: the bidirectional A* find_path used to run. It alternates strictly
+    # between the sides and stops at the first box the other side has reached, so
+    # its corridor is not always the cheapest. Same arguments and result as _a_star_bi.
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+    forward_estimate = nm_pathfinder._heuristic(mesh, goal, heuristic)
+    backward_estimate = nm_pathfinder._heuristic(mesh, start, heuristic)
+    blocked = mesh.get("blocked") or ()
+    expanded = pushes = reopened = 0
+
+    # Copies for each direction of the Search
+    forward_queue = [(0, start)]  # (priority, box)
+    forward_prev = dict()
+    forward_dist = dict()
+    forward_dist[start] = 0
+
+    backward_queue = [(0, goal)]  # (priority, box)
+    backward_prev = dict()
+    backward_dist = dict()
+    backward_dist[goal] = 0
+
+    intersection_box = None  # Common box found by both searches
+
+    while forward_queue and backward_queue:
+        forward_priority, forward_curr_box = heappop(forward_queue)
+        # Check if current box is visited by backwards search
+        if forward_curr_box in backward_prev:
+            intersection_box = forward_curr_box
+            break
+        expanded += 1
+
+        for e in range(offsets[forward_curr_box], offsets[forward_curr_box + 1]):
+            forward_neighbor_box = neighbors[e]
+            if forward_neighbor_box in blocked:
+                continue
+            new_forward_distance = forward_dist[forward_curr_box] + costs[e]
+            # Update distance and priority if shorter path found
+            if forward_neighbor_box not in forward_dist or new_forward_distance < forward_dist[forward_neighbor_box]:
+                if forward_neighbor_box in forward_dist:
+                    reopened += 1
+                forward_dist[forward_neighbor_box] = new_forward_distance
+                forward_priority = new_forward_distance + forward_estimate(forward_neighbor_box)
+                forward_prev[forward_neighbor_box] = forward_curr_box
+                if forward_priority < inf:
+                    heappush(forward_queue, (forward_priority, forward_neighbor_box))
+                    pushes += 1
+
+        backward_priority, backward_curr_box = heappop(backward_queue)
+
+        if backward_curr_box in forward_prev:
+            intersection_box = backward_curr_box
+            break
+        expanded += 1
+
+        for e in range(offsets[backward_curr_box], offsets[backward_curr_box + 1]):
+            backward_neighbor_box = neighbors[e]
+            if backward_neighbor_box in blocked:
+                continue
+            new_backward_distance = backward_dist[backward_curr_box] + costs[e]
+            if backward_neighbor_box not in backward_dist or new_backward_distance < backward_dist[backward_neighbor_box]:
+                if backward_neighbor_box in backward_dist:
+                    reopened += 1
+                backward_dist[backward_neighbor_box] = new_backward_distance
+                backward_priority = new_backward_distance + backward_estimate(backward_neighbor_box)
+                backward_prev[backward_neighbor_box] = backward_curr_box
+                if backward_priority < inf:
+                    heappush(backward_queue, (backward_priority, backward_neighbor_box))
+                    pushes += 1
+    if stats is not None:
+        stats.expanded += expanded
+        stats.pushes += pushes
+        stats.reopened += reopened
+
+    if intersection_box is None:
+        return None
+
+    parent_dict = {}
+    current_box = intersection_box
+
+    # Construct the parent_dict from the intersection to the source box
+    while current_box in forward_prev:
+        parent_dict[current_box] = forward_prev[current_box]
+        current_box = forward_prev[current_box]
+
+    # Construct the parent_dict from the intersection to the goal box
+    current_box = intersection_box
+    while current_box in backward_prev:
+        parent_dict[backward_prev[current_box]] = current_box
+        current_box = backward_prev[current_box]
+
+    return parent_dict
+
+
+def benchmark_bidirectional(mesh, count=1000, seed=0, landmarks=8):
+    """ Compares _a_star_bi with the alternating bidirectional A* it replaced, and with A*.
+
+    Args:
+        mesh:       The navmesh to query.
+        count:      Number of random walkable point pairs.
+        seed:       Seed for the point pairs.
+        landmarks:  Number of ALT landmarks to build for the "alt" runs.
+
+    Returns:    A dict of {heuristic: {search: totals}}, plus how many corridors
+                the new search made cheaper or dearer.
+
+    """
+    build_landmarks(mesh, landmarks)
+    pairs = random_point_pairs(mesh, count, seed)
+    located = nm_pathfinder._locate_all(mesh, [point for pair in pairs for point in pair])
+    boxes = [(s, d) for s, d in zip(located[0::2], located[1::2]) if s is not None and d is not None]
+
+    # a_star finds the cheapest corridors too, as a reference for the expansions that takes
+    searches = (("alternating", alternating_a_star_bi), ("a_star", nm_pathfinder._a_star),
+                ("a_star_bi", nm_pathfinder._a_star_bi))
+    result = {"pairs": len(boxes), "landmarks": landmarks}
+    for heuristic in ("euclidean", "alt"):
+        totals = result[heuristic] = {}
+        costs = {}
+        for name, search in searches:
+            stats = SearchStats()
+            costs[name] = []
+            start = time()
+            for source, destination in boxes:
+                costs[name].append(corridor_cost(mesh, search(mesh, source, destination, heuristic, stats),
+                                                 source, destination))
+            found = [cost for cost in costs[name] if cost is not None]
+            totals[name] = {"expanded": stats.expanded, "found": len(found), "cost": sum(found),
+                            "time": time() - start}
+        pairs_costs = [(old, new) for old, new in zip(costs["alternating"], costs["a_star_bi"]) if old is not None]
+        totals["cheaper"] = sum(1 for old, new in pairs_costs if new is not None and new < old - 1e-9)
+        totals["dearer"] = sum(1 for old, new in pairs_costs if new is None or new > old + 1e-9)
+    return result
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(q / 100.0 * len(values) + 0.5)) - 1))]
+
+
+def _corridor_parents(corridor):
+    return None if corridor is None else dict(zip(corridor[1:], corridor))
+
+
+# Search strategies: (mesh, start box, goal box, stats) -> parent dict of box ids, or None
+STRATEGIES = {
+    "bfs": lambda mesh, start, goal, stats: nm_pathfinder._bfs(mesh, start, goal, stats),
+    "a_star": lambda mesh, start, goal, stats: nm_pathfinder._a_star(mesh, start, goal, "euclidean", stats),
+    "a_star_alt": lambda mesh, start, goal, stats: nm_pathfinder._a_star(mesh, start, goal, "alt", stats),
+    "a_star_bi": lambda mesh, start, goal, stats: nm_pathfinder._a_star_bi(mesh, start, goal, "euclidean", stats),
+    "a_star_bi_alt": lambda mesh, start, goal, stats: nm_pathfinder._a_star_bi(mesh, start, goal, "alt", stats),
+    "a_star_bi_alternating": lambda mesh, start, goal, stats: alternating_a_star_bi(mesh, start, goal, "euclidean", stats),
+    "hierarchical": lambda mesh, start, goal, stats: _corridor_parents(hierarchical_search(mesh, start, goal, stats)),
+    "contraction": lambda mesh, start, goal, stats: _corridor_parents(contraction_search(mesh, start, goal, stats)),
+}
+
+
+def synthetic_walkable(size, seed=0, cell=16, walls=0.3, obstacles=None):
+    """ A reproducible size x size map: a grid of blocked cells plus round obstacles.
+
+    Args:
+        size:       Side of the map in pixels.
+        seed:       Seed for the layout.
+        cell:       Side of the square cells that are walls with probability walls.
+        walls:      Fraction of cells that are walls.
+        obstacles:  Number of round obstacles (default: one per 80 x 80 pixels).
+
+    Returns:    A (size, size) bool array, True where walkable.
+
+    """
+    rng = np.random.default_rng(seed)
+    cells = rng.random(((size + cell - 1) // cell,) * 2) >= walls
+    walkable = np.kron(cells, np.ones((cell, cell), dtype=bool))[:size, :size]
+    rows, cols = np.ogrid[:size, :size]
+    for _ in range(size * size // 6400 if obstacles is None else obstacles):
+        x, y = rng.integers(0, size, 2)
+        radius = int(rng.integers(4, max(5, size // 32)))
+        x0, x1, y0, y1 = max(0, x - radius), x + radius + 1, max(0, y - radius), y + radius + 1
+        walkable[x0:x1, y0:y1] &= (rows[x0:x1] - x) ** 2 + (cols[:, y0:y1] - y) ** 2 >= radius * radius
+    return walkable
+
+
+def synthetic_mesh(size, seed=0):
+    # {"boxes", "adj"} mesh (already compacted) of a synthetic_walkable map
+    return build_mesh(synthetic_walkable(size, seed))
+
+
+def benchmark_searches(mesh, count=1000, seed=0, strategies=None, memory_pairs=100):
+    """ Runs every search strategy on the same reproducible walkable point pairs.
+
+    Pairs whose endpoints are in different components are skipped, since
+    find_path rejects those before searching. Latency covers the box search
+    only; path length is that of the detail points find_path would return.
+    Memory is the tracemalloc peak of a query, measured in a separate pass
+    over the first memory_pairs pairs (tracing slows everything down).
+
+    Args:
+        mesh:           The navmesh to query.
+        count:          Number of random point pairs drawn.
+        seed:           Seed for the point pairs.
+        strategies:     Names from STRATEGIES (default: all of them).
+        memory_pairs:   Pairs in the memory pass; 0 skips it.
+
+    Returns:    A JSON-ready dict of mesh size, index build times and per-strategy results.
+
+    """
+    strategies = list(STRATEGIES) if strategies is None else strategies
+    compact_mesh(mesh)
+
+    # Indexes are built up front so their cost stays out of the query latencies
+    builds = {}
+    for name, build, users in (("components", build_components, strategies),
+                               ("landmarks", build_landmarks, ("a_star_alt", "a_star_bi_alt")),
+                               ("hierarchy", build_hierarchy, ("hierarchical",)),
+                               ("contraction", build_contraction, ("contraction",))):
+        if any(strategy in users for strategy in strategies):
+            start = time()
+            build(mesh)
+            builds[name] = time() - start
+
+    labels = nm_pathfinder.component_labels(mesh)
+    pairs = random_point_pairs(mesh, count, seed)
+    located = nm_pathfinder._locate_all(mesh, [point for pair in pairs for point in pair])
+    queries = []
+    for (source_point, destination_point), source, destination in zip(pairs, located[0::2], located[1::2]):
+        if source is not None and destination is not None and labels[source] == labels[destination]:
+            queries.append((source, destination, source_point, destination_point))
+
+    result = {
+        "mesh": {"boxes": len(mesh["bounds"]), "edges": len(mesh["neighbors"])},
+        "pairs": len(queries), "seed": seed, "builds": builds, "strategies": {},
+        "python": platform.python_version(),
+    }
+    for name in strategies:
+        search = STRATEGIES[name]
+        stats = SearchStats()
+        times = []
+        found = 0
+        cost = 0.0
+        length = 0.0
+        for source, destination, source_point, destination_point in queries:
+            start = time()
+            parent_dict = search(mesh, source, destination, stats)
+            times.append(time() - start)
+            path_cost = corridor_cost(mesh, parent_dict, source, destination)
+            if path_cost is None:
+                continue
+            found += 1
+            cost += path_cost
+            if source != destination:
+                path, _ = nm_pathfinder._reconstruct(mesh, parent_dict, source, destination,
+                                                     source_point, destination_point)
+                length += sum(nm_pathfinder.euclidean_distance(a, b) for a, b in zip(path, path[1:]))
+
+        peaks = []
+        if memory_pairs:
+            tracemalloc.start()
+            for source, destination, _, _ in queries[:memory_pairs]:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                search(mesh, source, destination, None)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            tracemalloc.stop()
+
+        times.sort()
+        result["strategies"][name] = {
+            "mean": sum(times) / len(times) if times else None,
+            "p50": percentile(times, 50), "p95": percentile(times, 95), "p99": percentile(times, 99),
+            "max": times[-1] if times else None,
+            "expanded": stats.expanded, "expanded_per_query": stats.expanded / len(queries) if queries else None,
+            "found": found, "cost": cost, "path_length": length,
+            "memory_peak_mean": sum(peaks) / len(peaks) if peaks else None,
+            "memory_peak_max": max(peaks) if peaks else None,
+        }
+    return result
+
+
+def load_benchmark_mesh(spec):
+    # A mesh pickle, or "synthetic:SIZE[:SEED]" for a generated map
+    if spec.startswith('synthetic:'):
+        size, _, seed = spec[len('synthetic:'):].partition(':')
+        return synthetic_mesh(int(size), int(seed or 0))
+    with open(spec, 'rb') as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {}
+    for flag in ('--json', '--count', '--seed', '--strategies'):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+
+    if len(args) < 1:
+        print("Usage: python nm_benchmark.py locate|heuristics|contraction|bidirectional|searches "
+              "[mesh.pickle | synthetic:SIZE] "
+              "[--count N] [--seed S] [--strategies a,b] [--json out.json]")
+        exit(1)
+
+    mesh = load_benchmark_mesh(args[1] if len(args) > 1 else 'test_image.mesh.pickle')
+
+    if args[0] == 'locate':
+        result = benchmark_locate(mesh)
+        print("%d points, %d grid cells (built in %.4f s)" % (result["points"], result["cells"], result["build"]))
+        for name in ("scan", "get_boxes", "locate_points"):
+            print("%-14s %8.4f s  %8.2f us/point" % (name, result[name], 1e6 * result[name] / result["points"]))
+    elif args[0] == 'heuristics':
+        result = benchmark_heuristics(mesh)
+        print("%d box pairs, %d landmarks (built in %.3f s)" % (result["pairs"], result["landmarks"], result["build"]))
+        for name in ("a_star", "a_star_bi"):
+            for heuristic, totals in result[name].items():
+                print("%-10s %-10s %9d expanded  %8.1f per query  cost %12.1f  %7.3f s" % (
+                    name, heuristic, totals["expanded"], totals["expanded"] / result["pairs"],
+                    totals["cost"], totals["time"]))
+    elif args[0] == 'contraction':
+        result = benchmark_contraction(mesh)
+        print("%d point pairs, contraction built in %.3f s with %d shortcuts" % (
+            result["pairs"], result["build"], result["shortcuts"]))
+        for name in ("a_star_bi", "contraction"):
+            totals = result[name]
+            print("%-12s mean %8.1f us  p50 %8.1f us  max %8.1f us  found %d  cost %12.1f" % (
+                name, 1e6 * totals["mean"], 1e6 * totals["p50"], 1e6 * totals["max"], totals["found"], totals["cost"]))
+    elif args[0] == 'bidirectional':
+        result = benchmark_bidirectional(mesh, int(options.get('--count', 1000)), int(options.get('--seed', 0)))
+        print("%d point pairs, %d landmarks" % (result["pairs"], result["landmarks"]))
+        for heuristic in ("euclidean", "alt"):
+            totals = result[heuristic]
+            for name in ("alternating", "a_star", "a_star_bi"):
+                print("%-10s %-12s %9d expanded  %8.1f per query  cost %12.1f  %7.3f s" % (
+                    heuristic, name, totals[name]["expanded"], totals[name]["expanded"] / max(result["pairs"], 1),
+                    totals[name]["cost"], totals[name]["time"]))
+            print("%-10s %d corridors cheaper, %d dearer" % (heuristic, totals["cheaper"], totals["dearer"]))
+    elif args[0] == 'searches':
+        strategies = options['--strategies'].split(',') if '--strategies' in options else None
+        result = benchmark_searches(mesh, int(options.get('--count', 1000)), int(options.get('--seed', 0)), strategies)
+        print("%d boxes, %d edges, %d point pairs" % (result["mesh"]["boxes"], result["mesh"]["edges"], result["pairs"]))
+        for name, totals in result["strategies"].items():
+            print("%-14s p50 %9.1f us  p95 %9.1f us  p99 %9.1f us  %8.1f expanded/query  cost %12.1f  "
+                  "length %12.1f  peak %8.1f KiB" % (
+                      name, 1e6 * totals["p50"], 1e6 * totals["p95"], 1e6 * totals["p99"],
+                      totals["expanded_per_query"], totals["cost"], totals["path_length"],
+                      (totals["memory_peak_mean"] or 0) / 1024))
+    else:
+        print("Unknown benchmark: " + args[0])
+        exit(1)
+
+    if '--json' in options:
+        with open(options['--json'], 'w') as f:
+            json.dump(result, f, indent=2)
+        print("Wrote " + options['--json'])
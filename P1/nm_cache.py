@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+
+class CorridorCache:
+    """ Bounded LRU cache of box corridors keyed by (source box, destination box, search).
+
+    Queries whose points fall in the same pair of boxes get the same corridor
+    from the search, so find_path(cache=...) only reruns the point
+    constraining pass for them. Misses with no path are cached too.
+
+    The cache belongs to one mesh and empties itself whenever the mesh's
+    version changes (see nm_mesh.block_box).
+    """
+
+    __slots__ = ("capacity", "hits", "misses", "version", "entries")
+
+    MISSING = object()
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, mesh, key):
+        """ Returns the cached corridor (None for no path), or CorridorCache.MISSING. """
+        version = mesh.get("version", 0)
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        corridor = self.entries.get(key, self.MISSING)
+        if corridor is self.MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return corridor
+
+    def put(self, key, corridor):
+        self.entries[key] = corridor
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {"size": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+def corridor_cache(mesh, capacity=1024):
+    """ Returns the mesh's own CorridorCache (mesh["corridor_cache"]), creating it on first use. """
+    cache = mesh.get("corridor_cache")
+    if cache is None:
+        cache = mesh["corridor_cache"] = CorridorCache(capacity)
+    return cache
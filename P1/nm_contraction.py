@@ -0,0 +1,302 @@
+import sys
+from heapq import heappop, heappush
+from math import inf
+
+import numpy as np
+
+from nm_mesh import compact_mesh, load_pickle, mesh_fingerprint, replace_file, views
+
+
+def build_contraction(mesh, witness_limit=64):
+    """
+    Builds a contraction hierarchy over the box graph
+
+    Boxes are contracted one at a time, least important first (by edge
+    difference: shortcuts added minus edges removed, plus contracted
+    neighbors). Contracting a box adds a shortcut between two of its
+    remaining neighbors unless a witness search finds a path between them
+    that is no longer than going through it. Every shortcut remembers the box
+    it skips, so a query can unpack it back into real adjacencies.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        witness_limit: boxes a witness search may settle before giving up (and adding the shortcut)
+
+    Returns:
+        The index, also stored in mesh["contraction"]: the rank of every box
+        and the upward graph in CSR form ("offsets", "targets", "costs",
+        "middle"), where middle is -1 for a real edge or the skipped box
+    """
+    compact_mesh(mesh)
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+    n = len(mesh["bounds"])
+
+    # Remaining graph: box -> {neighbor: (cost, middle)}
+    graph = [dict() for _ in range(n)]
+    for box in range(n):
+        for e in range(offsets[box], offsets[box + 1]):
+            graph[box][neighbors[e]] = (costs[e], -1)
+
+    rank = [-1] * n
+    contracted_neighbors = [0] * n
+
+    def shortcuts(box):
+        # Shortcuts contracting box would add right now
+        edges = graph[box]
+        added = []
+        remaining = list(edges)
+        for i, u in enumerate(remaining):
+            targets = {w: edges[u][0] + edges[w][0] for w in remaining[i + 1:]}
+            if not targets:
+                continue
+            witnesses = _witness_search(graph, u, box, targets, max(targets.values()), witness_limit)
+            for w, cost in targets.items():
+                if witnesses.get(w, inf) > cost:
+                    added.append((u, w, cost))
+        return added
+
+    def priority(box):
+        return len(shortcuts(box)) - len(graph[box]) + contracted_neighbors[box]
+
+    queue = [(priority(box), box) for box in range(n)]
+    queue.sort()
+    order = 0
+    while queue:
+        _, box = heappop(queue)
+        if rank[box] != -1:
+            continue
+
+        # Lazy update: re-queue if the box is no longer the cheapest to contract
+        current = priority(box)
+        if queue and current > queue[0][0]:
+            heappush(queue, (current, box))
+            continue
+
+        for u, w, cost in shortcuts(box):
+            if cost < graph[u].get(w, (inf,))[0]:
+                graph[u][w] = (cost, box)
+                graph[w][u] = (cost, box)
+
+        rank[box] = order
+        order += 1
+        for u in graph[box]:
+            contracted_neighbors[u] += 1
+            # Upward edges stay on box; u only keeps edges to the uncontracted graph
+            del graph[u][box]
+
+    # Upward graph, CSR: edges of each box to higher-ranked boxes
+    up_offsets = [0]
+    targets, up_costs, middle = [], [], []
+    for box in range(n):
+        for u, (cost, skipped) in graph[box].items():
+            targets.append(u)
+            up_costs.append(cost)
+            middle.append(skipped)
+        up_offsets.append(len(targets))
+
+    contraction = {
+        "fingerprint": np.array(mesh_fingerprint(mesh)),
+        "rank": np.array(rank, dtype=np.int32),
+        "offsets": np.array(up_offsets, dtype=np.int32),
+        "targets": np.array(targets, dtype=np.int32),
+        "costs": np.array(up_costs, dtype=np.float64),
+        "middle": np.array(middle, dtype=np.int32),
+    }
+    mesh["contraction"] = contraction
+    return contraction
+
+
+def _witness_search(graph, source, excluded, targets, limit, settle_limit):
+    # Dijkstra from source avoiding excluded, up to cost limit; distances to the targets reached
+    frontier = [(0, source)]
+    distance_table = {source: 0}
+    found = {}
+    settled = 0
+    while frontier and settled < settle_limit:
+        distance, current = heappop(frontier)
+        if distance > distance_table[current]:
+            continue
+        if distance > limit:
+            break
+        settled += 1
+        if current in targets:
+            found[current] = distance
+            if len(found) == len(targets):
+                break
+        for box, (cost, _) in graph[current].items():
+            if box == excluded:
+                continue
+            new_distance = distance + cost
+            if new_distance < distance_table.get(box, inf):
+                distance_table[box] = new_distance
+                heappush(frontier, (new_distance, box))
+    return found
+
+
+def contraction_path(mesh_path):
+    # Index file kept next to the mesh: test_image.mesh.pickle -> test_image.mesh.ch.npz
+    if mesh_path.endswith('.pickle'):
+        mesh_path = mesh_path[:-len('.pickle')]
+    return mesh_path + '.ch.npz'
+
+
+def save_contraction(contraction, path):
+    # Replaced in one step: servers may be reading the old file
+    names = ("fingerprint", "rank", "offsets", "targets", "costs", "middle")
+    replace_file(path, lambda f: np.savez(f, **{name: contraction[name] for name in names}))
+
+
+def load_contraction(mesh, mesh_path=None, witness_limit=64):
+    """
+    Returns the mesh's contraction hierarchy, loading it from its index file
+    or building it in memory when there is no usable file
+
+    The file is only written offline (python nm_contraction.py mesh.pickle),
+    never from a query. It is used when its box count and fingerprint
+    (nm_mesh.mesh_fingerprint) match the mesh, so a file left over from an
+    earlier version of the mesh is ignored.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        mesh_path: mesh pickle or compact prefix; defaults to the file the mesh was loaded
+            from, mesh["source"] (nm_mesh.load_pickle) or mesh["path"] (nm_mesh.load_mesh)
+        witness_limit: used when the index has to be built
+
+    Returns:
+        The index dict, also stored in mesh["contraction"]
+    """
+    if "contraction" in mesh:
+        return mesh["contraction"]
+
+    mesh_path = mesh_path or mesh.get("source") or mesh.get("path")
+    if mesh_path is not None:
+        try:
+            with np.load(contraction_path(mesh_path)) as data:
+                contraction = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            contraction = None
+        if contraction is not None and "fingerprint" in contraction \
+                and len(contraction["rank"]) == len(mesh["boxes"]) \
+                and str(contraction["fingerprint"]) == mesh_fingerprint(mesh):
+            mesh["contraction"] = contraction
+            return contraction
+
+    return build_contraction(mesh, witness_limit)
+
+
+def contraction_search(mesh, start, goal, stats=None):
+    """
+    Finds a shortest corridor of box ids from start to goal with the contraction hierarchy
+
+    Two Dijkstra searches, from start and from goal, only follow edges to
+    higher-ranked boxes. Each side stops once its frontier can no longer
+    beat the best meeting point. The shortcuts on the winning route are then
+    unpacked into real adjacencies.
+
+    Args:
+        stats: optional nm_stats.SearchStats; boxes expanded and pushed on either side are counted
+
+    Returns:
+        The list of box ids from start to goal, or None if there is no path
+    """
+    contraction = load_contraction(mesh)
+    ch = contraction.get("views")
+    if ch is None:
+        ch = {name: contraction[name].tolist() for name in ("offsets", "targets", "costs", "middle")}
+        contraction["views"] = ch
+    offsets, targets, costs = ch["offsets"], ch["targets"], ch["costs"]
+
+    forward = ([(0, start)], {start: 0}, {start: None})
+    backward = ([(0, goal)], {goal: 0}, {goal: None})
+    best, meeting = inf, None
+    expanded = pushes = 0
+
+    while True:
+        # Always advance the side whose frontier is cheaper
+        candidates = [side for side in (forward, backward) if side[0] and side[0][0][0] < best]
+        if not candidates:
+            break
+        frontier, distance_table, parent_dict = min(candidates, key=lambda side: side[0][0][0])
+        other_distances = backward[1] if frontier is forward[0] else forward[1]
+
+        distance, current = heappop(frontier)
+        if distance > distance_table[current]:
+            continue
+        expanded += 1
+        if current in other_distances and distance + other_distances[current] < best:
+            best = distance + other_distances[current]
+            meeting = current
+
+        for e in range(offsets[current], offsets[current + 1]):
+            box = targets[e]
+            new_distance = distance + costs[e]
+            if new_distance < distance_table.get(box, inf):
+                distance_table[box] = new_distance
+                parent_dict[box] = (current, e)
+                heappush(frontier, (new_distance, box))
+                pushes += 1
+
+    if stats is not None:
+        stats.expanded += expanded
+        stats.pushes += pushes
+
+    if meeting is None:
+        return None
+
+    # Upward edges from start to the meeting box, then from the meeting box down to goal
+    route = []
+    box = meeting
+    while forward[2][box] is not None:
+        parent, e = forward[2][box]
+        route.append((parent, box, e))
+        box = parent
+    route.reverse()
+    box = meeting
+    while backward[2][box] is not None:
+        parent, e = backward[2][box]
+        route.append((box, parent, e))
+        box = parent
+
+    corridor = [start]
+    for a, b, e in route:
+        corridor.extend(_unpack(ch, a, b, e))
+    return corridor
+
+
+def _unpack(ch, a, b, e):
+    # Boxes after a on the real path a -> b that edge e (a shortcut or a real edge) stands for
+    offsets, targets, middle = ch["offsets"], ch["targets"], ch["middle"]
+    unpacked = []
+    stack = [(a, b, e)]
+    while stack:
+        a, b, e = stack.pop()
+        skipped = middle[e]
+        if skipped == -1:
+            unpacked.append(b)
+            continue
+        # The skipped box was contracted first, so both halves are its upward edges
+        first = second = None
+        for f in range(offsets[skipped], offsets[skipped + 1]):
+            if targets[f] == a:
+                first = f
+            elif targets[f] == b:
+                second = f
+        stack.append((skipped, b, second))
+        stack.append((a, skipped, first))
+    return unpacked
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python nm_contraction.py mesh.pickle")
+        exit(1)
+
+    mesh_path = sys.argv[1]
+    mesh = load_pickle(mesh_path)
+
+    contraction = build_contraction(mesh)
+    save_contraction(contraction, contraction_path(mesh_path))
+    print("%d boxes, %d upward edges (%d shortcuts) -> %s" % (
+        len(contraction["rank"]), len(contraction["targets"]),
+        int((contraction["middle"] != -1).sum()), contraction_path(mesh_path)))
@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from heapq import heappop, heappush
+from math import inf
+from time import perf_counter
+
+import numpy as np
+
+from nm_mesh import flat, views
+from nm_pathfinder import _locate, _locate_all, _reconstruct, euclidean_distance
+
+
+def build_flow_field(mesh, destination_id, stats=None):
+    """
+    Runs one reverse Dijkstra from a destination box over the whole mesh
+
+    Edge costs are symmetric, so the parent of a box in the tree grown from
+    the destination is the first step of a shortest route to it. Blocked
+    boxes (see nm_mesh.block_box) are never entered.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        destination_id: id of the box every unit heads to
+        stats: optional nm_stats.SearchStats; boxes expanded and pushed are counted
+
+    Returns:
+        The field: "destination", "next_hop" (int32 per box, -1 at the
+        destination and where it cannot be reached), "distance" (float64 per
+        box, inf where it cannot be reached) and the mesh "version" it was built for
+    """
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+    blocked = mesh.get("blocked") or ()
+    n = len(mesh["bounds"])
+
+    next_hop = [-1] * n
+    distance_table = [inf] * n
+    expanded = pushes = 0
+    if destination_id not in blocked:
+        distance_table[destination_id] = 0
+        frontier = [(0, destination_id)]
+        while frontier:
+            distance, current = heappop(frontier)
+            if distance > distance_table[current]:
+                continue
+            expanded += 1
+            for e in range(offsets[current], offsets[current + 1]):
+                box = neighbors[e]
+                new_distance = distance + costs[e]
+                if new_distance < distance_table[box] and box not in blocked:
+                    distance_table[box] = new_distance
+                    next_hop[box] = current
+                    heappush(frontier, (new_distance, box))
+                    pushes += 1
+
+    if stats is not None:
+        stats.expanded += expanded
+        stats.pushes += pushes
+
+    return {
+        "destination": destination_id,
+        "next_hop": np.array(next_hop, dtype=np.int32),
+        "distance": np.array(distance_table, dtype=np.float64),
+        "version": mesh.get("version", 0),
+    }
+
+
+def flow_field(mesh, destination_id, capacity=16, stats=None):
+    """
+    Returns the flow field towards a destination box, from the mesh's cache when it can
+
+    Fields are kept in mesh["flow_fields"], least recently used first; the
+    oldest is evicted past capacity. A field built before boxes were blocked
+    or unblocked is rebuilt.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        destination_id: id of the box every unit heads to
+        capacity: most fields to keep cached
+        stats: optional nm_stats.SearchStats, passed to build_flow_field
+
+    Returns:
+        The field, as build_flow_field returns it
+    """
+    cache = mesh.get("flow_fields")
+    if cache is None:
+        cache = mesh["flow_fields"] = OrderedDict()
+
+    field = cache.get(destination_id)
+    if field is not None and field["version"] == mesh.get("version", 0):
+        cache.move_to_end(destination_id)
+        return field
+
+    field = build_flow_field(mesh, destination_id, stats)
+    field["views"] = {"next_hop": flat(field["next_hop"]), "distance": flat(field["distance"])}
+    cache[destination_id] = field
+    cache.move_to_end(destination_id)
+    while len(cache) > capacity:
+        cache.popitem(last=False)
+    return field
+
+
+def field_corridor(field, source_id):
+    """
+    Returns:
+        The box ids from source_id to the field's destination, or None if it cannot be reached
+    """
+    destination_id = field["destination"]
+    v = field.get("views") or field
+    next_hop = v["next_hop"]
+    if v["distance"][source_id] == inf:
+        return None
+    corridor = [source_id]
+    current = source_id
+    while current != destination_id:
+        current = next_hop[current]
+        corridor.append(current)
+    return corridor
+
+
+def find_paths_to(source_points, destination_point, mesh, smooth=False, capacity=16, stats=None):
+    """
+    Paths from many source points to one destination, all read from a single flow field
+
+    Args:
+        source_points: iterable of starting points
+        destination_point: the rally point every path ends at
+        mesh: pathway constraints the path adheres to
+        smooth: pull each path tight through its corridor's portals (see nm_pathfinder.funnel)
+        capacity: most flow fields to keep cached in the mesh
+        stats: optional nm_stats.SearchStats that collects counters and phase timings
+
+    Returns:
+        A list with one (path, boxes) result per source point, in the shape find_path returns
+    """
+    source_points = list(source_points)
+    if stats is not None:
+        stats.queries += len(source_points)
+        clock = perf_counter()
+
+    destination_id = _locate(mesh, destination_point)
+    located = _locate_all(mesh, source_points)
+    if stats is not None:
+        clock = stats.lap("locate", clock)
+
+    results = [([], {}.keys()) for _ in source_points]
+    if destination_id is None:
+        return results
+
+    field = flow_field(mesh, destination_id, capacity, stats)
+    if stats is not None:
+        clock = stats.lap("search", clock)
+
+    for i, (source_point, source_id) in enumerate(zip(source_points, located)):
+        corridor = None if source_id is None else field_corridor(field, source_id)
+        if corridor is None:
+            continue
+        parent_dict = dict(zip(corridor[1:], corridor))
+        path, boxes = _reconstruct(mesh, parent_dict, source_id, destination_id, source_point, destination_point,
+                                   smooth)
+        results[i] = (path, boxes.keys())
+        if stats is not None:
+            stats.found += 1
+            stats.path_boxes += len(boxes)
+            stats.path_length += sum(euclidean_distance(a, b) for a, b in zip(path, path[1:]))
+
+    if stats is not None:
+        stats.lap("reconstruct", clock)
+    return results
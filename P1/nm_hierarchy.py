@@ -0,0 +1,250 @@
+import pickle
+import sys
+from heapq import heappop, heappush
+
+import numpy as np
+
+from nm_mesh import compact_mesh, load_pickle, mesh_fingerprint, replace_file, views
+
+
+def build_hierarchy(mesh, region_size=128):
+    """
+    Builds the abstract layer used by hierarchical search
+
+    Boxes are clustered into square regions of region_size by their centre.
+    Entrances are the boxes with a neighbor in another region. The abstract
+    graph joins entrances by the real edges that cross a region border and by
+    the shortest path between two entrances that stays inside their region.
+    Abstract costs are therefore exact, and a route found at that level
+    refines into a path through the mesh of the same cost.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        region_size: side of a region, in mesh units
+
+    Returns:
+        The hierarchy dict, also stored in mesh["hierarchy"]
+    """
+    compact_mesh(mesh)
+    bounds = mesh["bounds"].astype(np.int64)
+    rows = (bounds[:, 0] + bounds[:, 1]) // (2 * region_size)
+    cols = (bounds[:, 2] + bounds[:, 3]) // (2 * region_size)
+    region_of = (rows * (int(cols.max()) + 1 if len(cols) else 1) + cols).tolist()
+
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+
+    members = {}
+    for box, r in enumerate(region_of):
+        members.setdefault(r, []).append(box)
+
+    graph = {}
+    for box, r in enumerate(region_of):
+        for e in range(offsets[box], offsets[box + 1]):
+            neighbor = neighbors[e]
+            if region_of[neighbor] != r:
+                graph.setdefault(box, {})[neighbor] = costs[e]
+
+    # Exact intra-region costs between the entrances of each region
+    for box in list(graph):
+        distance_table, _ = _region_search(mesh, region_of, box)
+        for other in members[region_of[box]]:
+            if other != box and other in graph and other in distance_table:
+                graph[box][other] = distance_table[other]
+
+    hierarchy = {
+        "boxes": len(region_of),
+        "fingerprint": mesh_fingerprint(mesh),
+        "region_size": region_size,
+        "region": region_of,
+        "graph": {box: list(edges.items()) for box, edges in graph.items()},
+    }
+    mesh["hierarchy"] = hierarchy
+    return hierarchy
+
+
+def hierarchy_path(mesh_path):
+    # Cache file kept next to the mesh: test_image.mesh.pickle -> test_image.mesh.hierarchy.pickle
+    if mesh_path.endswith('.pickle'):
+        mesh_path = mesh_path[:-len('.pickle')]
+    return mesh_path + '.hierarchy.pickle'
+
+
+def save_hierarchy(hierarchy, path):
+    # Replaced in one step: servers may be reading the old file
+    replace_file(path, lambda f: pickle.dump(hierarchy, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_hierarchy(mesh, mesh_path=None, region_size=None):
+    """
+    Returns the mesh's hierarchy, loading it from its cache file or building
+    it in memory when there is no usable file
+
+    The file is only written offline (python nm_hierarchy.py mesh.pickle), never
+    from a query. It is used when its box count, region size and fingerprint
+    (nm_mesh.mesh_fingerprint) match, so a file left over from an earlier
+    version of the mesh is ignored.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        mesh_path: mesh pickle or compact prefix; defaults to the file the mesh was loaded
+            from, mesh["source"] (nm_mesh.load_pickle) or mesh["path"] (nm_mesh.load_mesh)
+        region_size: required region size; None accepts any, and builds with 128
+
+    Returns:
+        The hierarchy dict, also stored in mesh["hierarchy"]
+    """
+    hierarchy = mesh.get("hierarchy")
+    if hierarchy is not None and region_size in (None, hierarchy["region_size"]):
+        return hierarchy
+
+    mesh_path = mesh_path or mesh.get("source") or mesh.get("path")
+    if mesh_path is not None:
+        path = hierarchy_path(mesh_path)
+        try:
+            with open(path, 'rb') as f:
+                hierarchy = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            hierarchy = None
+        if hierarchy is not None and region_size in (None, hierarchy.get("region_size")) \
+                and hierarchy.get("boxes") == len(mesh["boxes"]) \
+                and hierarchy.get("fingerprint") == mesh_fingerprint(mesh):
+            mesh["hierarchy"] = hierarchy
+            return hierarchy
+
+    return build_hierarchy(mesh, 128 if region_size is None else region_size)
+
+
+def hierarchical_search(mesh, start, goal, stats=None):
+    """
+    Finds a corridor of box ids from start to goal with the hierarchy
+
+    start and goal are linked to the entrances of their regions, a coarse A*
+    runs over the entrance graph, and each leg of the coarse route is then
+    refined by a search restricted to the single region it crosses.
+
+    Args:
+        stats: optional nm_stats.SearchStats; abstract nodes expanded and pushed are counted
+
+    Returns:
+        The list of box ids from start to goal, or None if there is no path
+    """
+    hierarchy = load_hierarchy(mesh)
+    region_of = hierarchy["region"]
+    graph = hierarchy["graph"]
+    bounds = views(mesh)["bounds"]
+
+    if start == goal:
+        return [start]
+
+    # Temporary abstract edges for the endpoints
+    start_distances, _ = _region_search(mesh, region_of, start)
+    goal_distances, _ = _region_search(mesh, region_of, goal)
+    start_edges = [(box, start_distances[box]) for box in start_distances if box in graph]
+    goal_edges = {box: goal_distances[box] for box in goal_distances if box in graph}
+    if goal in start_distances:
+        start_edges.append((goal, start_distances[goal]))
+
+    frontier = [(0, start)]
+    parent_dict = {start: None}
+    distance_table = {start: 0}
+    expanded = pushes = reopened = 0
+    while frontier:
+        _, current = heappop(frontier)
+        if current == goal:
+            break
+        expanded += 1
+
+        edges = graph.get(current, ())
+        if current == start:
+            edges = start_edges + list(edges)
+        if current in goal_edges:
+            edges = list(edges) + [(goal, goal_edges[current])]
+        for box, cost in edges:
+            new_distance = distance_table[current] + cost
+            if box not in distance_table or new_distance < distance_table[box]:
+                if box in distance_table:
+                    reopened += 1
+                distance_table[box] = new_distance
+                parent_dict[box] = current
+                heappush(frontier, (new_distance + _distance(bounds, box, goal), box))
+                pushes += 1
+
+    if stats is not None:
+        stats.expanded += expanded
+        stats.pushes += pushes
+        stats.reopened += reopened
+
+    if goal not in parent_dict:
+        return None
+
+    route = [goal]
+    while route[-1] != start:
+        route.append(parent_dict[route[-1]])
+    route.reverse()
+
+    # Refinement: crossing edges are real adjacencies, the rest stay in one region
+    corridor = [start]
+    for a, b in zip(route, route[1:]):
+        if region_of[a] != region_of[b]:
+            corridor.append(b)
+        else:
+            _, parents = _region_search(mesh, region_of, a, b)
+            leg = [b]
+            while leg[-1] != a:
+                leg.append(parents[leg[-1]])
+            corridor.extend(reversed(leg[:-1]))
+    return corridor
+
+
+def _region_search(mesh, region_of, start, goal=None):
+    # Dijkstra from start over the boxes of its own region, stopping early at goal.
+    # Returns the (distance, parent) tables of the boxes reached.
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+    region = region_of[start]
+
+    frontier = [(0, start)]
+    parent_dict = {start: None}
+    distance_table = {start: 0}
+    closed = set()
+    while frontier:
+        distance, current = heappop(frontier)
+        if current in closed:
+            continue
+        closed.add(current)
+        if current == goal:
+            break
+
+        for e in range(offsets[current], offsets[current + 1]):
+            box = neighbors[e]
+            if region_of[box] != region:
+                continue
+            new_distance = distance + costs[e]
+            if box not in distance_table or new_distance < distance_table[box]:
+                distance_table[box] = new_distance
+                parent_dict[box] = current
+                heappush(frontier, (new_distance, box))
+
+    return distance_table, parent_dict
+
+
+def _distance(bounds, start, goal):
+    # Same straight-line estimate as nm_pathfinder's A*
+    start, goal = 4 * start, 4 * goal
+    return pow((pow((bounds[goal] - bounds[start]), 2) + pow((bounds[goal + 1] - bounds[start + 1]), 2)), 0.5)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python nm_hierarchy.py mesh.pickle [region size]")
+        exit(1)
+
+    mesh_path = sys.argv[1]
+    region_size = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    mesh = load_pickle(mesh_path)
+
+    hierarchy = build_hierarchy(mesh, region_size)
+    save_hierarchy(hierarchy, hierarchy_path(mesh_path))
+    print("%d regions, %d entrances -> %s" % (len(set(hierarchy["region"])), len(hierarchy["graph"]),
+                                               hierarchy_path(mesh_path)))
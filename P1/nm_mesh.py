@@ -0,0 +1,533 @@
+import hashlib
+import os
+import pickle
+import sys
+from collections.abc import Mapping, Sequence
+from heapq import heappop, heappush
+from math import inf, sqrt
+
+import numpy as np
+
+# Arrays that make up the compact mesh; each is saved as <prefix>.<name>.npy
+ARRAYS = ("bounds", "offsets", "neighbors", "portals", "costs", "landmarks", "components", "grid", "cells", "items")
+
+
+def compact_mesh(mesh):
+    """
+    Adds the array-backed representation of the mesh, in place
+
+    Boxes become integer ids (their position in mesh["boxes"]), their
+    (x1, x2, y1, y2) tuples an (n, 4) int32 "bounds" array, and mesh["adj"]
+    a CSR adjacency: the neighbors of box i are neighbors[offsets[i]:offsets[i + 1]].
+    Position e in that slice is the edge id of i -> neighbors[e], which
+    indexes the portal table (see build_portals).
+
+    Args:
+        mesh: a {"boxes", "adj"} mesh, or one already compacted or loaded
+
+    Returns:
+        The same mesh dict
+    """
+    if "offsets" in mesh:
+        if "portals" not in mesh:
+            build_portals(mesh)
+        return mesh
+
+    boxes = mesh["boxes"]
+    ids = box_ids(mesh)
+
+    offsets = [0]
+    neighbors = []
+    for box in boxes:
+        # Adjacency lists may repeat a neighbor; the CSR keeps each once
+        neighbors.extend(ids[n] for n in dict.fromkeys(mesh["adj"].get(box, ())))
+        offsets.append(len(neighbors))
+
+    mesh["bounds"] = np.array(boxes, dtype=np.int32).reshape(-1, 4)
+    mesh["offsets"] = np.array(offsets, dtype=np.int32)
+    mesh["neighbors"] = np.array(neighbors, dtype=np.int32)
+    build_portals(mesh)
+    return mesh
+
+
+def build_portals(mesh):
+    """
+    Precomputes the portal (shared border) and cost of every adjacency edge
+
+    For edge e from box i to box j, portals[e] is the (x1, x2, y1, y2) border
+    get_border returns for the pair and costs[e] their euclidean_distance.
+
+    Args:
+        mesh: a compacted mesh
+
+    Returns:
+        The (portals, costs) arrays, also stored in the mesh
+    """
+    bounds = mesh["bounds"].astype(np.int64)
+    neighbors = mesh["neighbors"]
+    sources = np.repeat(np.arange(len(bounds)), np.diff(mesh["offsets"]))
+    a, b = bounds[sources], bounds[neighbors]
+
+    portals = np.stack([np.maximum(a[:, 0], b[:, 0]), np.minimum(a[:, 1], b[:, 1]),
+                        np.maximum(a[:, 2], b[:, 2]), np.minimum(a[:, 3], b[:, 3])], axis=1)
+
+    # Same pow() as euclidean_distance so searches see bit-identical costs
+    squared = (b[:, 0] - a[:, 0]) ** 2 + (b[:, 1] - a[:, 1]) ** 2
+    costs = np.array([pow(value, 0.5) for value in squared.tolist()], dtype=np.float64)
+
+    mesh["portals"] = portals.astype(np.int32)
+    mesh["costs"] = costs
+    return mesh["portals"], mesh["costs"]
+
+
+def build_landmarks(mesh, count=8):
+    """
+    Picks landmark boxes and stores their distance to every box for the ALT heuristic
+
+    Landmarks are chosen farthest-first: each new one is the box whose
+    distance to the landmarks picked so far is largest, starting from the
+    box farthest from box 0. Only boxes connected to box 0 are candidates;
+    elsewhere the heuristic falls back to the straight line.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        count: number of landmarks K
+
+    Returns:
+        A (K, n) float32 array of landmark-to-box distances (inf where
+        unreachable), also stored in mesh["landmarks"]
+    """
+    compact_mesh(mesh)
+    n = len(mesh["bounds"])
+    count = min(count, n)
+
+    rows = []
+    nearest = np.array(graph_distances(mesh, 0)) if n else np.zeros(0)
+    nearest[np.isinf(nearest)] = -1
+    for _ in range(count):
+        landmark = int(np.argmax(nearest))
+        row = np.array(graph_distances(mesh, landmark))
+        rows.append(row)
+        nearest = np.minimum(nearest, row)
+
+    landmarks = np.array(rows, dtype=np.float32).reshape(count, n)
+    mesh["landmarks"] = landmarks
+    mesh.pop("views", None)
+    return landmarks
+
+
+def build_components(mesh):
+    """
+    Labels the connected components of the box graph
+
+    Two boxes share a label exactly when a path joins them, so comparing
+    labels answers reachability in O(1).
+
+    Args:
+        mesh: pathway constraints the path adheres to
+
+    Returns:
+        An int32 array with the component label of every box, also stored in
+        mesh["components"]; labels are numbered from 0 in order of their lowest box id
+    """
+    v = views(mesh)
+    offsets, neighbors = v["offsets"], v["neighbors"]
+    n = len(mesh["bounds"])
+
+    labels = [-1] * n
+    label = 0
+    for root in range(n):
+        if labels[root] != -1:
+            continue
+        labels[root] = label
+        frontier = [root]
+        while frontier:
+            current = frontier.pop()
+            for e in range(offsets[current], offsets[current + 1]):
+                box = neighbors[e]
+                if labels[box] == -1:
+                    labels[box] = label
+                    frontier.append(box)
+        label += 1
+
+    mesh["components"] = np.array(labels, dtype=np.int32)
+    mesh.pop("views", None)
+    return mesh["components"]
+
+
+def graph_distances(mesh, root):
+    # Dijkstra over the edge costs: distance from box root to every box (inf if unreachable)
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+
+    distance_table = [inf] * len(mesh["bounds"])
+    distance_table[root] = 0
+    frontier = [(0, root)]
+    while frontier:
+        distance, current = heappop(frontier)
+        if distance > distance_table[current]:
+            continue
+        for e in range(offsets[current], offsets[current + 1]):
+            box = neighbors[e]
+            new_distance = distance + costs[e]
+            if new_distance < distance_table[box]:
+                distance_table[box] = new_distance
+                heappush(frontier, (new_distance, box))
+    return distance_table
+
+
+def block_box(mesh, box_id):
+    """
+    Marks a box impassable (a closed door, a new obstacle) without touching
+    the adjacency or the compact arrays
+
+    Blocked boxes are kept in mesh["blocked"], and every change bumps
+    mesh["version"] so planners holding on to earlier searches (see
+    nm_replan) know to repair them. find_path, find_paths and the
+    time-sliced searches route around blocked boxes. The precomputed
+    hierarchy and contraction indexes do not, so while any box is blocked
+    find_path's hierarchical mode falls back to bidirectional A*.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        box_id: position of the box in mesh["boxes"]
+
+    Returns:
+        True if the box was not blocked before
+    """
+    blocked = mesh.setdefault("blocked", set())
+    if box_id in blocked:
+        return False
+    blocked.add(box_id)
+    mesh["version"] = mesh.get("version", 0) + 1
+    return True
+
+
+def unblock_box(mesh, box_id):
+    """
+    Makes a box blocked with block_box passable again
+
+    Returns:
+        True if the box was blocked before
+    """
+    blocked = mesh.get("blocked")
+    if not blocked or box_id not in blocked:
+        return False
+    blocked.discard(box_id)
+    mesh["version"] = mesh.get("version", 0) + 1
+    return True
+
+
+def set_box_cost(mesh, box_id, factor=1):
+    """
+    Makes a box dearer to cross (mud, a crowd) by scaling the cost of every
+    edge into or out of it
+
+    Factors are kept in mesh["box_costs"], and every change bumps
+    mesh["version"] like block_box. nm_replan's Replanner repairs its search
+    for them; the other searches keep using the plain edge costs.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        box_id: position of the box in mesh["boxes"]
+        factor: at least 1, so distances stay a lower bound of costs; 1 restores the plain cost
+
+    Returns:
+        True if the box's factor changed
+    """
+    if factor < 1:
+        raise ValueError("box cost factor must be at least 1, not %r" % factor)
+    factors = mesh.setdefault("box_costs", {})
+    if factors.get(box_id, 1) == factor:
+        return False
+    if factor == 1:
+        del factors[box_id]
+    else:
+        factors[box_id] = factor
+    mesh["version"] = mesh.get("version", 0) + 1
+    return True
+
+
+def box_ids(mesh):
+    # Box tuple -> integer id, built on first use
+    ids = mesh.get("ids")
+    if ids is None:
+        ids = {box: i for i, box in enumerate(mesh["boxes"])}
+        mesh["ids"] = ids
+    return ids
+
+
+def mesh_fingerprint(mesh):
+    """
+    A digest of the mesh's boxes and adjacency, computed once per mesh
+
+    Index files built from a mesh (nm_hierarchy, nm_contraction) store it,
+    so an index left over from an earlier version of the mesh file is
+    recognised and not used.
+
+    Returns:
+        A hex string
+    """
+    fingerprint = mesh.get("fingerprint")
+    if fingerprint is None:
+        compact_mesh(mesh)
+        digest = hashlib.sha1()
+        for name in ("bounds", "offsets", "neighbors"):
+            digest.update(np.ascontiguousarray(mesh[name], dtype=np.int32).tobytes())
+        fingerprint = mesh["fingerprint"] = digest.hexdigest()
+    return fingerprint
+
+
+def replace_file(path, write):
+    """
+    Writes a file by calling write with a file object open on a temporary
+    file next to path, then renames it over path, so readers never see a
+    partly written file
+    """
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(temporary, 'wb') as f:
+            write(f)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def views(mesh):
+    """
+    Returns flat memoryviews over the mesh arrays, cached in mesh["views"]
+
+    Indexing a memoryview yields plain Python ints about as fast as a list,
+    without copying the (possibly memory-mapped) arrays.
+    """
+    cached = mesh.get("views")
+    if cached is None:
+        compact_mesh(mesh)
+        cached = {name: flat(mesh[name]) for name in ("bounds", "offsets", "neighbors", "portals", "costs")}
+        for name in ("landmarks", "components"):
+            if name in mesh:
+                cached[name] = flat(mesh[name])
+        mesh["views"] = cached
+    return cached
+
+
+def index_views(mesh):
+    # views() plus the grid index buckets ("start", "items")
+    cached = views(mesh)
+    if "items" not in cached:
+        index = mesh.get("index") or build_index(mesh)
+        cached["start"] = flat(index["start"])
+        cached["items"] = flat(index["items"])
+    return cached
+
+
+def flat(array):
+    # Flat memoryview over a numeric array: indexing it yields plain Python numbers
+    return memoryview(np.ascontiguousarray(array)).cast('B').cast(array.dtype.char)
+
+
+def build_index(mesh, cell_size=None):
+    """
+    Builds a uniform grid over the mesh so point location only tests the few
+    boxes overlapping one grid cell. The index is stored in mesh["index"].
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        cell_size: side of a grid cell, defaults to the mean box side
+
+    Returns:
+        The index: grid geometry plus bucket offsets ("start") into a flat
+        array of box ids ("items"), one bucket per cell
+    """
+    boxes = mesh["boxes"]
+    if not len(boxes):
+        index = {"cell": 1, "origin": (0, 0), "rows": 0, "cols": 0,
+                 "start": np.zeros(1, dtype=np.int32), "items": np.zeros(0, dtype=np.int32)}
+        mesh["index"] = index
+        return index
+
+    x0 = min(box[0] for box in boxes)
+    x1 = max(box[1] for box in boxes)
+    y0 = min(box[2] for box in boxes)
+    y1 = max(box[3] for box in boxes)
+
+    if cell_size is None:
+        # Cells about the size of an average box keep buckets short
+        area = sum((box[1] - box[0]) * (box[3] - box[2]) for box in boxes)
+        cell_size = max(1, int(sqrt(area / len(boxes))))
+
+    rows = int((x1 - x0) // cell_size) + 1
+    cols = int((y1 - y0) // cell_size) + 1
+
+    buckets = [[] for _ in range(rows * cols)]
+    for box_id, box in enumerate(boxes):
+        # Borders are inclusive, so a box also lands in the cell its far edge touches
+        r_lo = int((box[0] - x0) // cell_size)
+        r_hi = int((box[1] - x0) // cell_size)
+        c_lo = int((box[2] - y0) // cell_size)
+        c_hi = int((box[3] - y0) // cell_size)
+        for r in range(r_lo, r_hi + 1):
+            for c in range(c_lo, c_hi + 1):
+                buckets[r * cols + c].append(box_id)
+
+    start = [0]
+    items = []
+    for bucket in buckets:
+        items.extend(bucket)
+        start.append(len(items))
+
+    index = {"cell": cell_size, "origin": (x0, y0), "rows": rows, "cols": cols,
+             "start": np.array(start, dtype=np.int32), "items": np.array(items, dtype=np.int32)}
+    mesh["index"] = index
+    return index
+
+
+def index_cell(index, point):
+    # Grid cell holding point, or None when it falls outside the mesh bounds
+    r = (point[0] - index["origin"][0]) // index["cell"]
+    c = (point[1] - index["origin"][1]) // index["cell"]
+    if not (0 <= r < index["rows"] and 0 <= c < index["cols"]):
+        return None
+    return int(r) * index["cols"] + int(c)
+
+
+def save_mesh(mesh, prefix):
+    """
+    Writes the compact mesh as <prefix>.<name>.npy files, one per array
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        prefix: output path without extension, e.g. "test_image.mesh"
+
+    Returns:
+        The list of files written
+    """
+    compact_mesh(mesh)
+    index = mesh.get("index") or build_index(mesh)
+    arrays = dict(mesh)
+    arrays["grid"] = np.array([index["cell"], index["origin"][0], index["origin"][1],
+                               index["rows"], index["cols"]], dtype=np.int32)
+    arrays["cells"] = index["start"]
+    arrays["items"] = index["items"]
+
+    written = []
+    for name in ARRAYS:
+        if name in arrays:
+            path = '%s.%s.npy' % (prefix, name)
+            np.save(path, np.asarray(arrays[name]))
+            written.append(path)
+    return written
+
+
+def load_mesh(prefix, mmap_mode='r'):
+    """
+    Loads a mesh written by save_mesh
+
+    With the default mmap_mode the arrays are memory-mapped, so loading is
+    instant and processes that load the same files share one copy of the
+    pages. "boxes" and "adj" are read-only views that build tuples on demand,
+    so code written against the pickled format keeps working.
+
+    Args:
+        prefix: path given to save_mesh
+        mmap_mode: passed to np.load; None reads the arrays into memory
+
+    Returns:
+        The mesh dict
+    """
+    mesh = {"path": prefix}
+    for name in ARRAYS:
+        path = '%s.%s.npy' % (prefix, name)
+        if os.path.exists(path):
+            mesh[name] = np.load(path, mmap_mode=mmap_mode)
+
+    if "grid" in mesh:
+        cell, x0, y0, rows, cols = (int(v) for v in mesh.pop("grid"))
+        mesh["index"] = {"cell": cell, "origin": (x0, y0), "rows": rows, "cols": cols,
+                         "start": mesh.pop("cells"), "items": mesh.pop("items")}
+
+    mesh["boxes"] = BoxList(mesh["bounds"])
+    mesh["adj"] = Adjacency(mesh)
+    return mesh
+
+
+def load_pickle(path):
+    """
+    Loads a mesh pickle and records where it came from in mesh["source"]
+
+    Indexes built from the mesh (nm_hierarchy, nm_contraction) are cached
+    in files next to that path, so a later process reads them instead of
+    building them again. Compact meshes from load_mesh record theirs in
+    mesh["path"].
+
+    Args:
+        path: the mesh pickle
+
+    Returns:
+        The mesh dict
+    """
+    with open(path, 'rb') as f:
+        mesh = pickle.load(f)
+    mesh["source"] = path
+    return mesh
+
+
+class BoxList(Sequence):
+    """ Read-only sequence of box tuples over an (n, 4) bounds array. """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [tuple(row) for row in self.bounds[i].tolist()]
+        return tuple(self.bounds[i].tolist())
+
+    def __iter__(self):
+        return iter([tuple(row) for row in self.bounds.tolist()])
+
+
+class Adjacency(Mapping):
+    """ Read-only box -> [neighbor boxes] mapping over the CSR adjacency. """
+
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def __getitem__(self, box):
+        i = box_ids(self.mesh)[box]
+        offsets, boxes = self.mesh["offsets"], self.mesh["boxes"]
+        return [boxes[j] for j in self.mesh["neighbors"][offsets[i]:offsets[i + 1]].tolist()]
+
+    def __iter__(self):
+        return iter(self.mesh["boxes"])
+
+    def __len__(self):
+        return len(self.mesh["boxes"])
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    landmarks = 8
+    if '--landmarks' in args:
+        i = args.index('--landmarks')
+        landmarks = int(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) < 1:
+        print("Usage: python nm_mesh.py mesh.pickle [output prefix] [--landmarks K]")
+        exit(1)
+
+    mesh_path = args[0]
+    prefix = args[1] if len(args) > 1 else os.path.splitext(mesh_path)[0]
+    mesh = load_pickle(mesh_path)
+
+    build_components(mesh)
+    if landmarks:
+        build_landmarks(mesh, landmarks)
+
+    for path in save_mesh(mesh, prefix):
+        print("Wrote " + path)
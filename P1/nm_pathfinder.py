@@ -1,7 +1,14 @@
 from heapq import heappop, heappush
 from math import inf, sqrt
+from time import perf_counter
 
-def find_path(source_point, destination_point, mesh):
+from nm_cache import CorridorCache
+from nm_hierarchy import hierarchical_search
+from nm_stats import SearchStats
+from nm_mesh import build_components, build_landmarks, compact_mesh, box_ids, index_cell, index_views, views
+
+def find_path(source_point, destination_point, mesh, heuristic="euclidean", hierarchical=False, smooth=False,
+              cache=None, stats=None, any_angle=False):
     """
     Searches for a path from source_point to destination_point through the mesh
     
@@ -9,6 +16,13 @@ def find_path(source_point, destination_point, mesh):
         source_point: starting point of the pathfinder
         destination_point: the ultimate goal the pathfinder must reach
         mesh: pathway constraints the path adheres to
+        heuristic: "euclidean" (straight line) or "alt" (landmarks, see build_landmarks)
+        hierarchical: search the region hierarchy (see nm_hierarchy) instead of the whole mesh
+        smooth: pull the path tight through the corridor's portals (see funnel)
+        cache: optional nm_cache.CorridorCache reused across queries (see nm_cache.corridor_cache)
+        stats: optional nm_stats.SearchStats that collects counters and phase timings
+        any_angle: plan straight segments over points with Theta* (see theta_star) instead of
+            searching boxes; heuristic, hierarchical, smooth and cache do not apply
         
     Returns:
         A path (list of points) from source_point to destination_point if exists
@@ -17,75 +31,342 @@ def find_path(source_point, destination_point, mesh):
     # Top Left = (0, 0)
     # Bottom Right = (height, width)
 
-    # List of points to draw paths
+    # List of points to draw paths, and dict of the boxes along them
     path = []
-
-    # Dict of boxes visited (or enqueued)
     boxes = {}
 
+    # Instrumentation is only collected when a stats object is passed in
+    if stats is not None:
+        stats.queries += 1
+        expanded = stats.expanded
+        clock = perf_counter()
+
     # Identify the source and destination boxes
-    source_box = get_boxes(source_point, mesh)
-    destination_box = get_boxes(destination_point, mesh)
+    source_id = _locate(mesh, source_point)
+    destination_id = _locate(mesh, destination_point)
+    if stats is not None:
+        clock = stats.lap("locate", clock)
+
+    parent_dict = None
+    if (source_id is None) or (destination_id is None):
+        # Point is not within a box (On an outline of the pickled image)
+        pass
+    elif component_labels(mesh)[source_id] != component_labels(mesh)[destination_id]:
+        # Boxes in different connected components can never be joined
+        pass
+    elif _is_blocked(mesh, source_id) or _is_blocked(mesh, destination_id):
+        # A blocked box (see nm_mesh.block_box) cannot be entered or left
+        pass
+    elif any_angle:
+        # Theta* plans the points themselves; there is no corridor left to reconstruct
+        path, boxes = theta_star(mesh, source_id, destination_id, source_point, destination_point, stats)
+    elif cache is not None:
+        # Points in the same pair of boxes share a corridor; only the detail points differ
+        key = (source_id, destination_id, "hierarchical" if hierarchical else heuristic)
+        corridor = cache.get(mesh, key)
+        if corridor is CorridorCache.MISSING:
+            parent_dict = _search(mesh, source_id, destination_id, heuristic, hierarchical, stats)
+            corridor = _corridor(parent_dict, source_id, destination_id)
+            cache.put(key, corridor)
+        if corridor is not None:
+            parent_dict = dict(zip(corridor[1:], corridor))
+    else:
+        parent_dict = _search(mesh, source_id, destination_id, heuristic, hierarchical, stats)
+    if stats is not None:
+        clock = stats.lap("search", clock)
+
+    if parent_dict is not None:
+        path, boxes = _reconstruct(mesh, parent_dict, source_id, destination_id, source_point, destination_point,
+                                   smooth)
 
-    # Point is not within a box (On an outline of the pickled image)
-    if (source_box is None) or (destination_box is None):
-        print("No path!")
-        return path, boxes.keys()
+    if stats is not None:
+        stats.lap("reconstruct", clock)
+        length = sum(euclidean_distance(a, b) for a, b in zip(path, path[1:]))
+        if path:
+            stats.found += 1
+            stats.path_boxes += len(boxes)
+            stats.path_length += length
+        stats.record(source=source_point, destination=destination_point, found=bool(path),
+                     expanded=stats.expanded - expanded, path_boxes=len(boxes), path_length=length)
+
+    # An empty path means there is no path: off the mesh, unreachable, or the searches never met
+    return path, boxes.keys()
+
+
+def _search(mesh, source_id, destination_id, heuristic="euclidean", hierarchical=False, stats=None):
+    # Dict of parent boxes from the search find_path runs, or None
+    if hierarchical and not mesh.get("blocked"):
+        # Dict of parent boxes along the refined hierarchical corridor; the hierarchy is built
+        # without blocked boxes in mind, so while any are blocked the plain search below runs instead
+        corridor = hierarchical_search(mesh, source_id, destination_id, stats)
+        return None if corridor is None else dict(zip(corridor[1:], corridor))
 
     # Dict of parent boxes found in Breadth First Search (BFS)
-    # parent_dict = bfs(mesh, source_box, destination_box)
+    # return _bfs(mesh, source_id, destination_id)
 
     # Dict of parent boxes found in A*
-    # parent_dict = a_star(mesh, source_box, destination_box)
-    # parent_dict.update({source_box: source_point})
+    # return _a_star(mesh, source_id, destination_id, heuristic, stats)
 
     # Dict of parent boxes found in Bidirectional A*
-    parent_dict = a_star_bi(mesh, source_box, destination_box)
-    parent_dict.update({source_box: source_point})
+    return _a_star_bi(mesh, source_id, destination_id, heuristic, stats)
 
-    # Modify your simple search to compute a legal list of line segments demonstrating the path.
-    # Instead of doing your search purely at the box level,
-    # add an extra table (dict) to keep track of the precise x,y position within that box that your path will traverse.
-    # In the solution code, we call this table 'detail_points', a dictionary that maps boxes to (x,y) pairs.
-    # Midpoints of boxes will not work for this assignment.
 
-    path_list = []
-    detail_points = {}
- 
-    # Successfully add boxes visited to path_list, still stuck on detail_points
-    get_path(path_list, detail_points, parent_dict, source_box, destination_box, source_point, destination_point)
+def _reconstruct(mesh, parent_dict, source_id, destination_id, source_point, destination_point, smooth=False):
+    # Points (destination first) and the dict of boxes along a search's parent table of box ids
+    path = []
+    boxes = {}
+    if smooth:
+        corridor = _corridor(parent_dict, source_id, destination_id)
+        if corridor is not None:
+            boxes = dict.fromkeys(mesh["boxes"][box] for box in corridor)
+            # Same order as the detail points: destination first
+            path = funnel(mesh, corridor, source_point, destination_point)[::-1]
+    else:
+        source_box = mesh["boxes"][source_id]
+        destination_box = mesh["boxes"][destination_id]
+        parent_dict = _box_parents(mesh, parent_dict)
+        parent_dict.update({source_box: source_point})
 
-    if len(path_list) == 0:
-        # Goal is NOT reachable from the start
-        print("No path!")
-        return path, boxes.keys()
-
-    # Goal is reachable from the start
-
-    # When the search terminates (assuming it found a path),
-    # construct a list of line segments to return by looking up the detail points for each box along the path.
-    # In this assignment, the order of the line segments is not important.
-    # What matters is that the line is legal by visual inspection of the visualization it produces.
-
-    # Add boxes visited
-    for box in path_list:
-        boxes.update({box: None})
-
-    # Print variables as needed
-    print(
-        f'Source Point: {source_point}\n'
-        # f'Source Box: {source_box}\n'
-        f'Destination Point: {destination_point}\n'
-        # f'Destination Box: {destination_box}\n'
-        f'Boxes Visited: {path_list}\n'
-        f'Detail_Points (Line Segment Points): {detail_points}\n'
-    )
-
-    for box in detail_points:
-        # Add line segments to be drawn (start_coordinates, end_coordinates) in any order
-        path.append(detail_points[box])
+        # Modify your simple search to compute a legal list of line segments demonstrating the path.
+        # Instead of doing your search purely at the box level,
+        # add an extra table (dict) to keep track of the precise x,y position within that box that your path will traverse.
+        # In the solution code, we call this table 'detail_points', a dictionary that maps boxes to (x,y) pairs.
+        # Midpoints of boxes will not work for this assignment.
 
-    return path, boxes.keys()
+        path_list = []
+        detail_points = {}
+
+        get_path(path_list, detail_points, parent_dict, source_box, destination_box, source_point, destination_point, mesh)
+
+        # When the search terminates (assuming it found a path),
+        # construct a list of line segments to return by looking up the detail points for each box along the path.
+        # In this assignment, the order of the line segments is not important.
+        # What matters is that the line is legal by visual inspection of the visualization it produces.
+
+        # Add boxes visited
+        for box in path_list:
+            boxes.update({box: None})
+
+        for box in detail_points:
+            # Add line segments to be drawn (start_coordinates, end_coordinates) in any order
+            path.append(detail_points[box])
+
+    return path, boxes
+
+def find_paths(pairs, mesh, processes=None, smooth=False, stats=None):
+    """
+    Searches for paths between many (source_point, destination_point) pairs
+
+    Endpoints are located in bulk and queries are grouped by destination box:
+    one shortest-path tree grown back from each destination box answers every
+    query that ends there. Nothing is printed.
+
+    Args:
+        pairs: iterable of (source_point, destination_point)
+        mesh: pathway constraints the path adheres to
+        processes: if given, destination groups are spread over a process pool of this size
+        smooth: pull each path tight through its corridor's portals (see funnel)
+        stats: optional nm_stats.SearchStats that collects counters and phase timings
+
+    Returns:
+        A list with one (path, boxes) result per pair, in the shape find_path returns
+    """
+    pairs = list(pairs)
+    if stats is not None:
+        stats.queries += len(pairs)
+        clock = perf_counter()
+
+    located = _locate_all(mesh, [point for pair in pairs for point in pair])
+    if stats is not None:
+        stats.lap("locate", clock)
+
+    labels = component_labels(mesh)
+
+    results = [([], {}.keys()) for _ in pairs]
+    groups = {}
+    for i, (source_point, destination_point) in enumerate(pairs):
+        source_id, destination_id = located[2 * i], located[2 * i + 1]
+        if (source_id is not None) and (destination_id is not None) and labels[source_id] == labels[destination_id] \
+                and not _is_blocked(mesh, source_id) and not _is_blocked(mesh, destination_id):
+            groups.setdefault(destination_id, []).append((i, source_id, source_point, destination_point))
+
+    tasks = [(destination_id, queries, smooth, stats is not None) for destination_id, queries in groups.items()]
+    if processes and len(tasks) > 1:
+        from multiprocessing import Pool
+
+        # Workers re-open a memory-mapped mesh from disk; others get a copy of the arrays
+        shared = mesh.get("path") or {name: mesh[name] for name in ("bounds", "offsets", "neighbors", "portals", "costs")}
+        with Pool(processes, initializer=_init_worker, initargs=(shared, mesh.get("blocked"))) as pool:
+            solved = pool.map(_solve_group, tasks, chunksize=max(1, len(tasks) // (4 * processes)))
+    else:
+        solved = [_solve_group(task, mesh) for task in tasks]
+
+    for group, group_stats in solved:
+        for i, path, path_boxes in group:
+            results[i] = (path, dict.fromkeys(path_boxes).keys())
+        if stats is not None:
+            stats.merge(group_stats)
+    return results
+
+
+_worker_mesh = None
+
+
+def _init_worker(shared, blocked=None):
+    global _worker_mesh
+    if isinstance(shared, str):
+        from nm_mesh import load_mesh
+        _worker_mesh = load_mesh(shared)
+    else:
+        _worker_mesh = dict(shared)
+    if blocked:
+        _worker_mesh["blocked"] = set(blocked)
+
+
+def _solve_group(task, mesh=None):
+    # Answers every query of one destination group from a single search tree
+    mesh = _worker_mesh if mesh is None else mesh
+    bounds = views(mesh)["bounds"]
+    destination_id, queries, smooth, collect = task
+    stats = SearchStats() if collect else None
+    if collect:
+        clock = perf_counter()
+
+    if len(queries) == 1:
+        # A lone query runs the same bidirectional search as find_path
+        i, source_id, source_point, destination_point = queries[0]
+        corridor = _corridor(_a_star_bi(mesh, source_id, destination_id, stats=stats), source_id, destination_id)
+        corridors = [corridor]
+    else:
+        next_box = _shortest_tree(mesh, destination_id, [query[1] for query in queries], stats)
+        corridors = []
+        for i, source_id, source_point, destination_point in queries:
+            corridor = None
+            if source_id in next_box:
+                corridor = [source_id]
+                while corridor[-1] != destination_id:
+                    corridor.append(next_box[corridor[-1]])
+            corridors.append(corridor)
+    if collect:
+        clock = stats.lap("search", clock)
+
+    solved = []
+    for (i, source_id, source_point, destination_point), corridor in zip(queries, corridors):
+        if corridor is None:
+            solved.append((i, [], []))
+            continue
+        if smooth:
+            path = funnel(mesh, corridor, source_point, destination_point)[::-1]
+        else:
+            path = _corridor_points(mesh, corridor, source_point, destination_point)
+        solved.append((i, path, [_box(bounds, box) for box in corridor]))
+        if collect:
+            stats.found += 1
+            stats.path_boxes += len(corridor)
+            stats.path_length += sum(euclidean_distance(a, b) for a, b in zip(path, path[1:]))
+    if collect:
+        stats.lap("reconstruct", clock)
+    return solved, stats
+
+
+def _corridor(parent_dict, start, goal):
+    # Box ids from start to goal following a search's parent table back from goal
+    if parent_dict is None:
+        return None
+    corridor = [goal]
+    while corridor[-1] != start:
+        if corridor[-1] not in parent_dict:
+            return None
+        corridor.append(parent_dict[corridor[-1]])
+    corridor.reverse()
+    return corridor
+
+
+def _shortest_tree(mesh, root, targets=None, stats=None):
+    # Dijkstra from root until every target is settled (or the component is exhausted).
+    # Edge costs are symmetric, so the parent of a box is its next hop towards root.
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+
+    arrays = _acquire_arrays(mesh)
+    seen, closed, distance_table, parent, generation = arrays.start()
+    seen[root] = generation
+    distance_table[root] = 0
+    parent[root] = -1
+
+    frontier = [(0, root)]
+    settled = []
+    remaining = None if targets is None else set(targets)
+    blocked = mesh.get("blocked") or ()
+    pushes = reopened = 0
+
+    try:
+        while frontier:
+            distance, current = heappop(frontier)
+            if closed[current] == generation:
+                continue
+            closed[current] = generation
+            settled.append(current)
+
+            if remaining is not None:
+                remaining.discard(current)
+                if not remaining:
+                    break
+
+            for e in range(offsets[current], offsets[current + 1]):
+                box = neighbors[e]
+                if box in blocked:
+                    continue
+                new_distance = distance + costs[e]
+                was_seen = seen[box] == generation
+                if not was_seen or new_distance < distance_table[box]:
+                    if was_seen:
+                        reopened += 1
+                    seen[box] = generation
+                    distance_table[box] = new_distance
+                    parent[box] = current
+                    heappush(frontier, (new_distance, box))
+                    pushes += 1
+
+        # Boxes only enqueued may still hold a provisional parent; keep settled ones
+        parent_dict = {box: parent[box] for box in settled}
+        parent_dict[root] = None
+        return parent_dict
+    finally:
+        _release_arrays(mesh, arrays)
+        if stats is not None:
+            stats.expanded += len(settled)
+            stats.pushes += pushes
+            stats.reopened += reopened
+
+
+def _corridor_points(mesh, corridor, source_point, destination_point):
+    # The detail points get_path produces for a corridor of box ids (source first),
+    # walking back from the destination and constraining the point to each portal
+    point = destination_point
+    path = [point]
+    for i in range(len(corridor) - 1, 0, -1):
+        point = constrain(_portal(mesh, corridor[i], corridor[i - 1]), point)
+        path.append(point)
+    path.append(source_point)
+    return path
+
+
+def _portal(mesh, box1, box2):
+    # Precomputed border between two adjacent boxes given by id
+    v = views(mesh)
+    offsets, neighbors, portals = v["offsets"], v["neighbors"], v["portals"]
+    for e in range(offsets[box1], offsets[box1 + 1]):
+        if neighbors[e] == box2:
+            p = 4 * e
+            return [portals[p], portals[p + 1], portals[p + 2], portals[p + 3]]
+    raise ValueError("boxes %d and %d are not adjacent" % (box1, box2))
+
+
+def _box(bounds, box_id):
+    # Box tuple for an id
+    b = 4 * box_id
+    return (bounds[b], bounds[b + 1], bounds[b + 2], bounds[b + 3])
 
 # 
 def get_boxes(point, mesh):
@@ -99,15 +380,151 @@ def get_boxes(point, mesh):
     Returns:
         The box that contains the point, or None if no box contains the point
     """
-    for box in mesh["boxes"]:
-        if (box[0] <= point[0] <= box[1]) and (box[2] <= point[1] <= box[3]):
-            return box
+    box_id = _locate(mesh, point)
+    if box_id is None:
+        return None
+    return mesh["boxes"][box_id]
+
+
+def locate_points(points, mesh):
+    """
+    Returns the boxes containing each of the given points
+
+    Args:
+        points: iterable of (x, y) coordinates
+        mesh: pathway constraints the path adheres to
+
+    Returns:
+        A list with the containing box (or None) for every point, in order
+    """
+    boxes = mesh["boxes"]
+    return [None if box_id is None else boxes[box_id] for box_id in _locate_all(mesh, points)]
+
+
+def get_components(points, mesh):
+    """
+    Returns the connected component label of the box under each point
+
+    Two points can only be joined by a path when their labels are equal, so
+    callers can drop hopeless queries from a batch before searching.
+
+    Args:
+        points: iterable of (x, y) coordinates
+        mesh: pathway constraints the path adheres to
+
+    Returns:
+        A list with the component label (or None off the mesh) for every point, in order
+    """
+    labels = component_labels(mesh)
+    return [None if box_id is None else labels[box_id] for box_id in _locate_all(mesh, points)]
+
+
+def component_labels(mesh):
+    # Component label of every box id, labelling the mesh on first use
+    if "components" not in mesh:
+        build_components(mesh)
+    return views(mesh)["components"]
+
+
+def _locate(mesh, point):
+    # Id of the box containing point, or None
+    v = index_views(mesh)
+    bounds, start, items = v["bounds"], v["start"], v["items"]
+
+    cell = index_cell(mesh["index"], point)
+    if cell is None:
+        return None
+
+    # Buckets hold box ids in mesh order, so ties on shared borders resolve
+    # to the same box a linear scan over mesh["boxes"] would return
+    for i in range(start[cell], start[cell + 1]):
+        b = 4 * items[i]
+        if (bounds[b] <= point[0] <= bounds[b + 1]) and (bounds[b + 2] <= point[1] <= bounds[b + 3]):
+            return items[i]
     return None
 
+
+def _locate_all(mesh, points):
+    # Box ids (or None) for many points, sharing one set of views
+    v = index_views(mesh)
+    bounds, start, items = v["bounds"], v["start"], v["items"]
+    index = mesh["index"]
+
+    located = []
+    for point in points:
+        found = None
+        cell = index_cell(index, point)
+        if cell is not None:
+            for i in range(start[cell], start[cell + 1]):
+                b = 4 * items[i]
+                if (bounds[b] <= point[0] <= bounds[b + 1]) and (bounds[b + 2] <= point[1] <= bounds[b + 3]):
+                    found = items[i]
+                    break
+        located.append(found)
+    return located
+
+
+def _is_blocked(mesh, box_id):
+    blocked = mesh.get("blocked")
+    return bool(blocked) and box_id in blocked
+
+
+def _box_parents(mesh, parent_ids):
+    # Id -> id parent table as the box tuple -> box tuple dict callers expect
+    boxes = mesh["boxes"]
+    return {boxes[child]: None if parent is None else boxes[parent]
+            for child, parent in parent_ids.items()}
+
+
+def _distance(bounds, start, goal):
+    # euclidean_distance between two boxes given by id
+    start, goal = 4 * start, 4 * goal
+    return pow((pow((bounds[goal] - bounds[start]), 2) + pow((bounds[goal + 1] - bounds[start + 1]), 2)), 0.5)
+
+
+def _heuristic(mesh, goal, heuristic="euclidean"):
+    # Estimate of the distance from a box id to goal, as a function of the box id.
+    # "alt" takes the best triangle-inequality bound |d(L, goal) - d(L, box)| over
+    # the landmarks L, never worse than the straight line it falls back on.
+    v = views(mesh)
+    bounds = v["bounds"]
+    if heuristic == "euclidean":
+        return lambda box: _distance(bounds, box, goal)
+    if heuristic != "alt":
+        raise ValueError("Unknown heuristic: %s" % heuristic)
+
+    if "landmarks" not in mesh:
+        build_landmarks(mesh)
+        v = views(mesh)
+    landmarks = v["landmarks"]
+    n = len(mesh["bounds"])
+    to_goal = [(row, landmarks[row + goal]) for row in range(0, len(landmarks), n)]
+
+    def alt(box):
+        best = _distance(bounds, box, goal)
+        for row, distance in to_goal:
+            # inf - inf is nan, which never wins the comparison
+            bound = abs(distance - landmarks[row + box])
+            if bound > best:
+                best = bound
+        return best
+
+    return alt
+
+
 def bfs(mesh, start, goal):
+    ids = box_ids(compact_mesh(mesh))
+    return _box_parents(mesh, _bfs(mesh, ids[start], ids[goal]))
+
+
+def _bfs(mesh, start, goal, stats=None):
     # IMPLEMENT THE SIMPLEST COMPLETE SEARCH ALGORITHM YOU CAN.
     # Starting with the source box, run BFS looking for a sequence of boxes that reaches the destination box.
     # You can also use this to evaluate your A* outputs!
+    v = views(mesh)
+    offsets, neighbors = v["offsets"], v["neighbors"]
+    blocked = mesh.get("blocked") or ()
+    expanded = 0
 
     frontier = [start]
     parent_dict = dict()
@@ -119,126 +536,628 @@ def bfs(mesh, start, goal):
         # Early exit BFS
         if current == goal:
             break
+        expanded += 1
 
-        for box in mesh["adj"][current]:
-            if box not in parent_dict:
+        for e in range(offsets[current], offsets[current + 1]):
+            box = neighbors[e]
+            if box not in parent_dict and box not in blocked:
                 frontier.append(box)
                 parent_dict[box] = current
 
+    if stats is not None:
+        stats.expanded += expanded
+        stats.pushes += len(parent_dict) - 1
     return parent_dict
 
-def a_star(mesh, start, goal):
-    frontier = [(0, start)]  # (priority, box)
-    parent_dict = dict()
-    distance_table = dict()  # distance from start to box
+
+def a_star(mesh, start, goal, heuristic="euclidean"):
+    ids = box_ids(compact_mesh(mesh))
+    return _box_parents(mesh, _a_star(mesh, ids[start], ids[goal], heuristic))
+
+
+def _a_star(mesh, start, goal, heuristic="euclidean", stats=None):
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+    estimate = _heuristic(mesh, goal, heuristic)
+    blocked = mesh.get("blocked") or ()
+    expanded = pushes = reopened = 0
+
+    # distance_table: distance from start to box, valid where seen[box] == generation
+    arrays = _acquire_arrays(mesh)
+    seen, _, distance_table, parent, generation = arrays.start()
+    seen[start] = generation
     distance_table[start] = 0
+    reached = []  # boxes given a parent, in the order they were first reached
 
-    while not len(frontier) == 0:
-        _, current = heappop(frontier) # lowest priority box
+    frontier = [(0, start)]  # (priority, box)
 
-        # Early exit A*
-        if current == goal:
-            break
+    try:
+        while not len(frontier) == 0:
+            _, current = heappop(frontier) # lowest priority box
 
-        for box in mesh["adj"][current]: # for all neighbors
-            new_distance = distance_table[current] + euclidean_distance(current, box)
-            if box not in distance_table or new_distance < distance_table[box]:
-                distance_table[box] = new_distance
-                priority = new_distance + euclidean_distance(box, goal)
-                heappush(frontier, (priority, box))
-                parent_dict[box] = current
+            # Early exit A*
+            if current == goal:
+                break
+            expanded += 1
 
-    return parent_dict
+            current_distance = distance_table[current]
+            for e in range(offsets[current], offsets[current + 1]): # for all neighbors
+                box = neighbors[e]
+                if box in blocked:
+                    continue
+                new_distance = current_distance + costs[e]
+                was_seen = seen[box] == generation
+                if not was_seen or new_distance < distance_table[box]:
+                    if was_seen:
+                        reopened += 1
+                    else:
+                        reached.append(box)
+                    seen[box] = generation
+                    distance_table[box] = new_distance
+                    priority = new_distance + estimate(box)
+                    parent[box] = current
+                    # An infinite estimate proves goal is unreachable from box
+                    if priority < inf:
+                        heappush(frontier, (priority, box))
+                        pushes += 1
 
-def a_star_bi(mesh, start, goal):
-    # Copies for each direction of the Search 
-    forward_queue = [(0, start, 'destination')]  # (priority, box, goal)
-    forward_prev = dict()
-    forward_dist = dict()
-    forward_dist[start] = 0
-    
-    backward_queue = [(0, goal, 'source')]  # (priority, box, goal)
-    backward_prev = dict()
-    backward_dist = dict()
-    backward_dist[goal] = 0
-
-    intersection_box = None  # Common box found by both searches
-
-    while forward_queue and backward_queue:
-        forward_priority, forward_curr_box, forward_curr_goal = heappop(forward_queue)
-        # Check if current box is visited by backwards search
-        if forward_curr_box in backward_prev:
-            intersection_box = forward_curr_box
-            break
-        
-        for forward_neighbor_box in mesh["adj"][forward_curr_box]:
-            new_forward_distance = forward_dist[forward_curr_box] + euclidean_distance(forward_curr_box, forward_neighbor_box)
-            # Update distance and priority if shorter path found
-            if forward_neighbor_box not in forward_dist or new_forward_distance < forward_dist[forward_neighbor_box]:
-                forward_dist[forward_neighbor_box] = new_forward_distance
-                forward_priority = new_forward_distance + euclidean_distance(forward_neighbor_box, goal)
-                heappush(forward_queue, (forward_priority, forward_neighbor_box, forward_curr_goal))
-                forward_prev[forward_neighbor_box] = forward_curr_box
-
-        backward_priority, backward_curr_box, backward_curr_goal = heappop(backward_queue)
-
-        if backward_curr_box in forward_prev:
-            intersection_box = backward_curr_box
-            break
+        return {box: parent[box] for box in reached}
+    finally:
+        _release_arrays(mesh, arrays)
+        if stats is not None:
+            stats.expanded += expanded
+            stats.pushes += pushes
+            stats.reopened += reopened
 
-        for backward_neighbor_box in mesh["adj"][backward_curr_box]:
-            new_backward_distance = backward_dist[backward_curr_box] + euclidean_distance(backward_curr_box, backward_neighbor_box)
-            if backward_neighbor_box not in backward_dist or new_backward_distance < backward_dist[backward_neighbor_box]:
-                backward_dist[backward_neighbor_box] = new_backward_distance
-                backward_priority = new_backward_distance + euclidean_distance(backward_neighbor_box, start)
-                heappush(backward_queue, (backward_priority, backward_neighbor_box, backward_curr_goal))
-                backward_prev[backward_neighbor_box] = backward_curr_box
 
-    if intersection_box is None:
+def a_star_bi(mesh, start, goal, heuristic="euclidean"):
+    ids = box_ids(compact_mesh(mesh))
+    parent_ids = _a_star_bi(mesh, ids[start], ids[goal], heuristic)
+    if parent_ids is None:
         return None
+    return _box_parents(mesh, parent_ids)
 
-    parent_dict = {}
-    current_box = intersection_box
 
-    # Construct the parent_dict from the intersection to the source box
-    while current_box in forward_prev:
-        parent_dict[current_box] = forward_prev[current_box]
-        current_box = forward_prev[current_box]
+def _a_star_bi(mesh, start, goal, heuristic="euclidean", stats=None):
+    steps = _a_star_bi_steps(mesh, start, goal, heuristic, stats)
+    try:
+        while True:
+            next(steps)
+    except StopIteration as finished:
+        return finished.value
 
-    # Construct the parent_dict from the intersection to the goal box
-    current_box = intersection_box
-    while current_box in backward_prev:
-        parent_dict[backward_prev[current_box]] = current_box
-        current_box = backward_prev[current_box]
 
-    return parent_dict
+def _a_star_bi_steps(mesh, start, goal, heuristic="euclidean", stats=None):
+    # Bidirectional A* as a generator: yields (side, box) after expanding each box,
+    # side 0 for the forward search and 1 for the backward one, and returns the
+    # parent dict (or None). Dropping it part way is fine; stats still get the counts.
+    #
+    # Both sides use the average of the two estimates, (to goal - to start) / 2 forward
+    # and its negative backward, so their priorities add up: a path through a box costs
+    # at least its priority on one side plus the lowest priority queued on the other.
+    # Every box reached by both sides is a meeting, and the cheapest one found so far
+    # is final once the two lowest priorities add up to its cost. Each step expands the
+    # side with fewer boxes queued.
+    v = views(mesh)
+    offsets, neighbors, costs = v["offsets"], v["neighbors"], v["costs"]
+    estimates = _balanced_estimates(mesh, start, goal, heuristic)
+    blocked = mesh.get("blocked") or ()
+    expanded = pushes = reopened = 0
+
+    # One set of arrays per side, reused from earlier queries: (seen, closed, distance, parent, generation)
+    arrays = (_acquire_arrays(mesh), _acquire_arrays(mesh))
+    sides = (arrays[0].start(), arrays[1].start())
+    queues = ([(estimates[0](start), start)], [(estimates[1](goal), goal)])  # (priority, box)
+    for (seen, _, distance, parent, generation), root in zip(sides, (start, goal)):
+        seen[root] = generation
+        distance[root] = 0
+        parent[root] = -1
+
+    # Cost of the best path found so far, and the box where its two halves meet
+    best, meeting = (0, start) if start == goal else (inf, None)
+
+    try:
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best:
+                break
+            side = 0 if len(queues[0]) <= len(queues[1]) else 1
+            queue, other_queue, estimate = queues[side], queues[1 - side], estimates[side]
+            seen, closed, distance, parent, generation = sides[side]
+            other_seen, other_closed, other_distance, _, other_generation = sides[1 - side]
+
+            _, current = heappop(queue)
+            if closed[current] == generation:
+                # Queued again with a lower priority and already expanded
+                continue
+            closed[current] = generation
+            expanded += 1
+            yield side, current
+
+            current_distance = distance[current]
+            for e in range(offsets[current], offsets[current + 1]):
+                box = neighbors[e]
+                if box in blocked:
+                    continue
+                new_distance = current_distance + costs[e]
+                was_seen = seen[box] == generation
+                if not was_seen or new_distance < distance[box]:
+                    if was_seen:
+                        reopened += 1
+                    seen[box] = generation
+                    distance[box] = new_distance
+                    parent[box] = current
+                    if other_seen[box] == other_generation:
+                        if new_distance + other_distance[box] < best:
+                            best = new_distance + other_distance[box]
+                            meeting = box
+                        if other_closed[box] == other_generation:
+                            # The other side already knows the rest of the way from here
+                            continue
+                    priority = new_distance + estimate(box)
+                    # Skip boxes no path through can beat the best meeting
+                    if priority < inf and not (other_queue and priority + other_queue[0][0] >= best):
+                        heappush(queue, (priority, box))
+                        pushes += 1
+
+        if meeting is None:
+            return None
+
+        # Boxes from the source to the meeting box, then on to the goal
+        forward_parent, backward_parent = sides[0][3], sides[1][3]
+        corridor = [meeting]
+        while forward_parent[corridor[-1]] != -1:
+            corridor.append(forward_parent[corridor[-1]])
+        corridor.reverse()
+        while backward_parent[corridor[-1]] != -1:
+            corridor.append(backward_parent[corridor[-1]])
+
+        # Edges can cost nothing (boxes side by side over the same rows), so the two
+        # halves may cross; cut out any loop
+        position = {}
+        simple = []
+        for box in corridor:
+            if box in position:
+                for dropped in simple[position[box] + 1:]:
+                    del position[dropped]
+                del simple[position[box] + 1:]
+            else:
+                position[box] = len(simple)
+                simple.append(box)
+        return dict(zip(simple[1:], simple))
+    finally:
+        _release_arrays(mesh, arrays[0])
+        _release_arrays(mesh, arrays[1])
+        if stats is not None:
+            stats.expanded += expanded
+            stats.pushes += pushes
+            stats.reopened += reopened
+
+
+def _balanced_estimates(mesh, start, goal, heuristic="euclidean"):
+    # (forward, backward) estimates for _a_star_bi_steps: half the difference of the
+    # estimates to goal and to start, which stays consistent on both sides. Same bounds
+    # as _heuristic, worked out together in one pass since it runs for every box pushed.
+    if heuristic not in ("euclidean", "alt"):
+        raise ValueError("Unknown heuristic: %s" % heuristic)
+    if heuristic == "alt" and "landmarks" not in mesh:
+        build_landmarks(mesh)
+    v = views(mesh)
+    bounds = v["bounds"]
+    sx1, sx2 = bounds[4 * start], bounds[4 * start + 1]
+    gx1, gx2 = bounds[4 * goal], bounds[4 * goal + 1]
+
+    rows = []
+    if heuristic == "alt":
+        landmarks = v["landmarks"]
+        n = len(mesh["bounds"])
+        rows = [(row, landmarks[row + goal], landmarks[row + start]) for row in range(0, len(landmarks), n)]
+
+    def forward(box):
+        b = 4 * box
+        x1, x2 = bounds[b], bounds[b + 1]
+        to_goal = sqrt((x1 - gx1) ** 2 + (x2 - gx2) ** 2)
+        to_start = sqrt((x1 - sx1) ** 2 + (x2 - sx2) ** 2)
+        for row, goal_distance, start_distance in rows:
+            # inf - inf is nan, which never wins the comparison
+            distance = landmarks[row + box]
+            bound = abs(goal_distance - distance)
+            if bound > to_goal:
+                to_goal = bound
+            bound = abs(start_distance - distance)
+            if bound > to_start:
+                to_start = bound
+        return (to_goal - to_start) / 2
+
+    return forward, lambda box: -forward(box)
+
+
+# Free SearchArrays kept per mesh for later searches
+SEARCH_ARRAYS_KEPT = 4
+
+
+class SearchArrays:
+    """ Per-box g-values, parents and closed flags for one direction of a search, reused across queries.
 
-def get_path(path_list, detail_points, parent_dict, start_box, current_box, start_point, goal_point):
+    Entries are only valid where seen[box] (closed[box] for the flags)
+    equals the generation handed out by start(), so starting a new search
+    is one increment instead of clearing (or allocating) arrays the size of
+    the mesh.
+    """
+
+    __slots__ = ("generation", "seen", "closed", "distance", "parent")
+
+    def __init__(self, size):
+        self.generation = 0
+        self.seen = [0] * size
+        self.closed = [0] * size
+        self.distance = [0.0] * size
+        self.parent = [-1] * size
+
+    def __len__(self):
+        return len(self.seen)
+
+    def start(self):
+        """ Invalidates every entry; returns (seen, closed, distance, parent, generation) for the new search. """
+        self.generation += 1
+        return self.seen, self.closed, self.distance, self.parent, self.generation
+
+
+def _acquire_arrays(mesh):
+    # A free SearchArrays of the mesh (mesh["search_arrays"]); searches running at the same
+    # time, like nm_timeslice's interleaved ones, each take their own
+    free = mesh.get("search_arrays")
+    if free is None:
+        free = mesh["search_arrays"] = []
+    size = len(mesh["bounds"])
+    while free:
+        arrays = free.pop()
+        if len(arrays) == size:
+            return arrays
+    return SearchArrays(size)
+
+
+def _release_arrays(mesh, arrays):
+    # Only a few are kept: each holds four lists the size of the mesh
+    free = mesh.setdefault("search_arrays", [])
+    if len(free) < SEARCH_ARRAYS_KEPT:
+        free.append(arrays)
+
+def get_path(path_list, detail_points, parent_dict, start_box, current_box, start_point, goal_point, mesh=None):
+    # Walks parent_dict back from current_box (the goal) to start_box. detail_points gets
+    # the goal point, then each box's point constrained to its border, then start_point;
+    # path_list gets the boxes from start_box to current_box.
     if len(path_list) == 0:
         detail_points.update({current_box: goal_point})
-    constrained_point = goal_point
 
     if current_box not in parent_dict:
         # goal is NOT reachable from the start
         return path_list
 
-    if current_box == start_box:
-        # Add a line segment in start_box
-        detail_points.update({parent_dict[current_box]: start_point})
-        path_list.append(start_box)
-    else:
+    ids = None if mesh is None else box_ids(mesh)
+    corridor = []
+    constrained_point = goal_point
+    first_point = None
+    while current_box != start_box:
+        if current_box not in parent_dict:
+            break
+        parent_box = parent_dict[current_box]
+
         # Add a line segment in current_box
         # When considering a move from one box to another, copy the x,y position within the current box
         # and constrain it (with mins and maxes) to the bounds of the destination box.
-        border = get_border(current_box, parent_dict[current_box])
+        # With a mesh the border comes from its precomputed portal table
+        if mesh is None:
+            border = get_border(current_box, parent_box)
+        else:
+            border = _portal(mesh, ids[current_box], ids[parent_box])
         constrained_point = constrain(border, constrained_point)
-        detail_points.update({parent_dict[current_box]: constrained_point})
+        detail_points.update({parent_box: constrained_point})
+        if first_point is None:
+            first_point = constrained_point
+
+        corridor.append(current_box)
+        current_box = parent_box
+    else:
+        # Add a line segment in start_box
+        detail_points.update({parent_dict[current_box]: start_point})
+        path_list.append(start_box)
+
+    corridor.reverse()
+    path_list.extend(corridor)
+    return goal_point if first_point is None else first_point
+
+
+def funnel(mesh, corridor, source_point, destination_point):
+    """
+    Pulls a path through a corridor of boxes as tight as it goes (string pulling)
+
+    The corridor is a chain of convex boxes joined by the portals of the
+    portal table, so the shortest path through it only bends at portal
+    endpoints. The funnel algorithm walks the portals once, keeping the
+    narrowest left and right bounds seen from the last waypoint.
 
-        get_path(path_list, detail_points, parent_dict, start_box, parent_dict[current_box], start_point, constrained_point)
+    Args:
+        mesh: pathway constraints the path adheres to
+        corridor: box ids from the source box to the destination box
+        source_point: starting point, inside the first box
+        destination_point: end point, inside the last box
+
+    Returns:
+        The waypoints from source_point to destination_point
+    """
+    bounds = views(mesh)["bounds"]
+    source_point, destination_point = tuple(source_point), tuple(destination_point)
+    lefts, rights = [source_point], [source_point]
+    for a, b in zip(corridor, corridor[1:]):
+        x1, x2, y1, y2 = _portal(mesh, a, b)
+        # Step across the portal towards b: along x for a portal on a row, along y otherwise
+        if x1 == x2:
+            step = (1 if bounds[4 * b] + bounds[4 * b + 1] > 2 * x1 else -1, 0)
+        else:
+            step = (0, 1 if bounds[4 * b + 2] + bounds[4 * b + 3] > 2 * y1 else -1)
+        p, q = (x1, y1), (x2, y2)
+        if _triarea2(p, (p[0] + step[0], p[1] + step[1]), q) < 0:
+            p, q = q, p
+        lefts.append(p)
+        rights.append(q)
+    lefts.append(destination_point)
+    rights.append(destination_point)
+
+    path = [source_point]
+    apex = left = right = source_point
+    apex_index = left_index = right_index = 0
+    i = 1
+    while i < len(lefts):
+        new_left, new_right = lefts[i], rights[i]
+
+        # Tighten the right bound, unless it crosses over the left one
+        if _triarea2(apex, right, new_right) <= 0:
+            if apex == right or _triarea2(apex, left, new_right) >= 0:
+                right, right_index = new_right, i
+            else:
+                # The left bound becomes a waypoint; restart from it
+                path.append(left)
+                apex = right = left
+                apex_index = right_index = left_index
+                i = apex_index + 1
+                continue
+
+        # Tighten the left bound, unless it crosses over the right one
+        if _triarea2(apex, left, new_left) >= 0:
+            if apex == left or _triarea2(apex, right, new_left) <= 0:
+                left, left_index = new_left, i
+            else:
+                path.append(right)
+                apex = left = right
+                apex_index = left_index = right_index
+                i = apex_index + 1
+                continue
+
+        i += 1
+
+    if path[-1] != destination_point:
+        path.append(destination_point)
+    return path
+
+
+def theta_star(mesh, source_id, destination_id, source_point, destination_point, stats=None):
+    """
+    Any-angle search: a path of straight segments between points, not confined to a box corridor
+
+    This is Lazy Theta* over the box graph. Every box is entered at one
+    point, and the segment into it may start from the entry point of its
+    parent's parent, skipping boxes in between as long as nothing blocks
+    the line of sight. That is assumed when a box is queued and checked
+    (line_of_sight) when it is expanded, so there is one check per
+    expansion. A last pass drops any waypoint the path can see past.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        source_id: id of the box containing source_point
+        destination_id: id of the box containing destination_point
+        source_point: starting point of the pathfinder
+        destination_point: the ultimate goal the pathfinder must reach
+        stats: optional nm_stats.SearchStats; boxes expanded and pushed are counted
+
+    Returns:
+        The path (points, destination first, as find_path returns them) and the
+        dict of boxes its segments pass through; both empty when there is no path
+    """
+    v = views(mesh)
+    offsets, neighbors, portals = v["offsets"], v["neighbors"], v["portals"]
+    blocked = mesh.get("blocked") or ()
+    source_point, destination_point = tuple(source_point), tuple(destination_point)
+    expanded = pushes = 0
+
+    # In plain sight: one segment, no search
+    direct = _segment_boxes(mesh, source_id, source_point, destination_point)
+    if direct is not None:
+        return [destination_point, source_point], dict.fromkeys(mesh["boxes"][box] for box in direct)
+
+    # Entry point of each box, and the box whose entry point the segment into it starts from
+    points = {source_id: source_point}
+    parents = {source_id: source_id}
+    distance_table = {source_id: 0}
+    frontier = [(euclidean_distance(source_point, destination_point), source_id)]
+    closed = set()
+
+    while frontier:
+        _, current = heappop(frontier)
+        if current in closed:
+            continue
+
+        parent = parents[current]
+        if parent != current and not line_of_sight(mesh, parent, points[parent], points[current]):
+            # The shortcut was blocked after all: enter from the best expanded neighbor instead
+            best = inf
+            for e in range(offsets[current], offsets[current + 1]):
+                box = neighbors[e]
+                if box in closed:
+                    p = 4 * e
+                    point = constrain((portals[p], portals[p + 1], portals[p + 2], portals[p + 3]), points[box])
+                    distance = distance_table[box] + euclidean_distance(points[box], point)
+                    if distance < best:
+                        best = distance
+                        parents[current], points[current] = box, point
+            distance_table[current] = best
+
+        if current == destination_id:
+            break
+        closed.add(current)
+        expanded += 1
 
-        path_list.append(current_box)
+        # Segments into the neighbors start from this box's parent: never longer than a bend here
+        origin = parents[current]
+        origin_point, origin_distance = points[origin], distance_table[origin]
+        for e in range(offsets[current], offsets[current + 1]):
+            box = neighbors[e]
+            if box in closed or box in blocked:
+                continue
+            p = 4 * e
+            point = constrain((portals[p], portals[p + 1], portals[p + 2], portals[p + 3]), origin_point)
+            distance = origin_distance + euclidean_distance(origin_point, point)
+            if distance < distance_table.get(box, inf):
+                distance_table[box] = distance
+                points[box] = point
+                parents[box] = origin
+                heappush(frontier, (distance + euclidean_distance(point, destination_point), box))
+                pushes += 1
+    else:
+        current = None
+
+    if stats is not None:
+        stats.expanded += expanded
+        stats.pushes += pushes
+    if current != destination_id:
+        return [], {}
+
+    # Waypoints (destination first) with the box each one is the entry point of
+    waypoints = [destination_point]
+    ids = [destination_id]
+    box = destination_id
+    while box != source_id:
+        if points[box] != waypoints[-1]:
+            waypoints.append(points[box])
+            ids.append(box)
+        box = parents[box]
+    if source_point != waypoints[-1]:
+        waypoints.append(source_point)
+        ids.append(source_id)
+    waypoints.reverse()
+    ids.reverse()
+
+    # Skip past every waypoint the path can see beyond
+    path, path_ids = [waypoints[0]], [ids[0]]
+    i = 0
+    while i < len(waypoints) - 1:
+        j = len(waypoints) - 1
+        while j > i + 1 and not line_of_sight(mesh, ids[i], waypoints[i], waypoints[j]):
+            j -= 1
+        path.append(waypoints[j])
+        path_ids.append(ids[j])
+        i = j
+
+    boxes = {}
+    for k in range(len(path) - 1):
+        for box in _segment_boxes(mesh, path_ids[k], path[k], path[k + 1]):
+            boxes[mesh["boxes"][box]] = None
+    return path[::-1], boxes
+
+
+# Line of sight results kept per mesh before the memo starts over
+LINE_OF_SIGHT_MEMO = 1 << 16
+
+
+def line_of_sight(mesh, start_id, start_point, end_point):
+    """
+    Tells whether the straight segment between two points stays on the mesh
+
+    Results are memoized in mesh["line_of_sight"], keyed by the start box and
+    both points, and forgotten when boxes are blocked or unblocked.
+
+    Args:
+        mesh: pathway constraints the path adheres to
+        start_id: id of a box containing start_point
+        start_point: one end of the segment
+        end_point: the other end
+
+    Returns:
+        True if the segment only crosses unblocked boxes
+    """
+    memo = mesh.get("line_of_sight")
+    version = mesh.get("version", 0)
+    if memo is None or memo["version"] != version:
+        memo = mesh["line_of_sight"] = {"version": version, "results": {}}
+    results = memo["results"]
+
+    key = (start_id, start_point, end_point)
+    clear = results.get(key)
+    if clear is None:
+        if len(results) >= LINE_OF_SIGHT_MEMO:
+            results.clear()
+        clear = results[key] = _segment_boxes(mesh, start_id, start_point, end_point) is not None
+    return clear
+
+
+def _segment_boxes(mesh, start_id, a, b):
+    # Box ids the segment a -> b passes through, from start_id (containing a) on, or None where it
+    # leaves the unblocked mesh. Walks the adjacency: each step moves to the neighbor the segment
+    # continues furthest in, by the segment parameter t in [0, 1].
+    v = views(mesh)
+    bounds, offsets, neighbors = v["bounds"], v["offsets"], v["neighbors"]
+    blocked = mesh.get("blocked") or ()
+    dx, dy = b[0] - a[0], b[1] - a[1]
 
-    return constrained_point
+    span = _clip(bounds, start_id, a, dx, dy)
+    if span is None:
+        return None
+    current, reach = start_id, span[1]
+    boxes = [current]
+    while reach < 1 - 1e-9:
+        best, best_reach = None, reach + 1e-9
+        # Only neighbors containing the exit point can continue the segment
+        x, y = a[0] + reach * dx, a[1] + reach * dy
+        for e in range(offsets[current], offsets[current + 1]):
+            box = neighbors[e]
+            n = 4 * box
+            if not (bounds[n] - 1e-6 <= x <= bounds[n + 1] + 1e-6 and bounds[n + 2] - 1e-6 <= y <= bounds[n + 3] + 1e-6):
+                continue
+            if box in blocked:
+                continue
+            span = _clip(bounds, box, a, dx, dy)
+            if span is not None and span[0] <= reach + 1e-9 and span[1] > best_reach:
+                best, best_reach = box, span[1]
+        if best is None:
+            return None
+        boxes.append(best)
+        current, reach = best, best_reach
+    return boxes
+
+
+def _clip(bounds, box_id, a, dx, dy):
+    # Range (t0, t1) of t in [0, 1] for which a + t * (dx, dy) is inside the (closed) box, or None
+    b = 4 * box_id
+    t0, t1 = 0.0, 1.0
+    for lo, hi, origin, d in ((bounds[b], bounds[b + 1], a[0], dx), (bounds[b + 2], bounds[b + 3], a[1], dy)):
+        if d == 0:
+            if origin < lo or origin > hi:
+                return None
+        else:
+            ta, tb = (lo - origin) / d, (hi - origin) / d
+            if ta > tb:
+                ta, tb = tb, ta
+            if ta > t0:
+                t0 = ta
+            if tb < t1:
+                t1 = tb
+    if t0 > t1 + 1e-9:
+        return None
+    return t0, t1
+
+
+def _triarea2(a, b, c):
+    # Twice the signed area of triangle abc: which side of a->b the point c is on
+    return (c[0] - a[0]) * (b[1] - a[1]) - (b[0] - a[0]) * (c[1] - a[1])
 
 
 def get_border(box1, box2):
@@ -253,24 +1172,13 @@ def get_border(box1, box2):
     border = [max(box1[0], box2[0]), min(box1[1], box2[1]),
               max(box1[2], box2[2]), min(box1[3], box2[3])]
 
-    # Print variables as needed
-    print(
-        f'B1: {box1}\n'
-        f'B2: {box2}\n'
-        f'Border: {border}\n'
-    )
-
     return border
 
 
 def constrain(border, constrained_point):
-    if not (border[0] < constrained_point[0] < border[1]):
-        constrained_point = (max(border[0], constrained_point[0]), constrained_point[1])
-        constrained_point = (min(border[1], constrained_point[0]), constrained_point[1])
-    if not (border[2] < constrained_point[1] < border[3]):
-        constrained_point = (constrained_point[0], max(border[2], constrained_point[1]))
-        constrained_point = (constrained_point[0], min(border[3], constrained_point[1]))
-    return constrained_point
+    # Clamp the point into the border, building a single tuple
+    x, y = constrained_point
+    return (min(border[1], max(border[0], x)), min(border[3], max(border[2], y)))
 
 
 def euclidean_distance(start, goal):
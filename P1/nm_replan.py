@@ -0,0 +1,212 @@
+from heapq import heappop, heappush
+from math import inf
+
+from nm_mesh import views
+from nm_pathfinder import _distance, _locate, _reconstruct, component_labels
+
+
+class Replanner:
+    """ A path from a moving agent to a fixed destination, kept up to date as box costs change.
+
+    This is D* Lite over the box graph. The search runs backwards from the
+    destination, so its g-values (cost to reach the destination) stay valid
+    while the agent moves. When boxes change with nm_mesh.block_box,
+    unblock_box or set_box_cost, only the boxes whose cost actually changed
+    are re-expanded instead of searching again from scratch.
+
+    Paths are shortest corridors by box cost, like a_star; they can differ
+    from what find_path's bidirectional search returns.
+    """
+
+    def __init__(self, mesh, source_point, destination_point, smooth=False, stats=None):
+        """
+        Args:
+            mesh: pathway constraints the path adheres to
+            source_point: current position of the agent
+            destination_point: the ultimate goal the pathfinder must reach
+            smooth: pull the path tight through the corridor's portals, as for find_path
+            stats: optional nm_stats.SearchStats that collects expansion counters
+        """
+        self.mesh = mesh
+        self.smooth = smooth
+        self.stats = stats
+        self.destination_point = destination_point
+        self.goal = _locate(mesh, destination_point)
+
+        v = views(mesh)
+        self._bounds, self._offsets, self._neighbors, self._costs = v["bounds"], v["offsets"], v["neighbors"], v["costs"]
+        self._size = len(mesh["bounds"])
+
+        self.g = {}
+        self.rhs = {}
+        self._frontier = []
+        self._keys = {}  # box -> key of its live frontier entry
+        self._km = 0
+        self._blocked = set(mesh.get("blocked") or ())
+        self._factors = dict(mesh.get("box_costs") or {})
+        self._version = mesh.get("version", 0)
+        self.expanded = 0
+
+        self.source_point = source_point
+        self.start = _locate(mesh, source_point)
+        self._last_start = self.start
+        if self.goal is not None:
+            self.rhs[self.goal] = 0
+            self._push(self.goal)
+
+    def move_to(self, source_point):
+        """ Moves the agent; the next path() plans from its new box, reusing the search. """
+        self.source_point = source_point
+        start = _locate(self.mesh, source_point)
+        if start is not None:
+            # Keys already queued were computed from the old box; km keeps them comparable
+            if self._last_start is not None:
+                self._km += _distance(self._bounds, self._last_start, start)
+            self._last_start = start
+        self.start = start
+
+    def path(self):
+        """
+        Repairs the search for any boxes blocked or unblocked since the last call
+        and returns the path from the agent's current point
+
+        Returns:
+            (path, boxes) in the shape find_path returns; both empty when there is no path
+        """
+        corridor = self.corridor()
+        if corridor is None:
+            return [], {}.keys()
+        parent_dict = dict(zip(corridor[1:], corridor))
+        path, boxes = _reconstruct(self.mesh, parent_dict, self.start, self.goal, self.source_point,
+                                   self.destination_point, self.smooth)
+        return path, boxes.keys()
+
+    def corridor(self):
+        """
+        Returns:
+            The box ids from the agent's box to the destination box, or None if there is no path
+        """
+        start, goal = self.start, self.goal
+        if start is None or goal is None:
+            return None
+        labels = component_labels(self.mesh)
+        if labels[start] != labels[goal]:
+            return None
+
+        self._update_blocked()
+        if start in self._blocked or goal in self._blocked:
+            return None
+        self._compute()
+        if self.g.get(start, inf) == inf:
+            return None
+
+        # Walk downhill: each box's best successor by edge cost plus g
+        offsets, neighbors, costs = self._offsets, self._neighbors, self._costs
+        corridor = [start]
+        current = start
+        while current != goal:
+            best, best_cost = None, inf
+            for e in range(offsets[current], offsets[current + 1]):
+                box = neighbors[e]
+                cost = self._cost(current, box, costs[e]) + self.g.get(box, inf)
+                if cost < best_cost:
+                    best, best_cost = box, cost
+            if best is None or len(corridor) > self._size:
+                return None
+            corridor.append(best)
+            current = best
+        return corridor
+
+    def _update_blocked(self):
+        # Boxes blocked, unblocked or given a new cost factor since the last repair change
+        # the cost of every edge touching them
+        if self.mesh.get("version", 0) == self._version:
+            return
+        blocked = set(self.mesh.get("blocked") or ())
+        factors = dict(self.mesh.get("box_costs") or {})
+        changed = blocked ^ self._blocked
+        changed.update(box for box in factors.keys() | self._factors.keys()
+                       if factors.get(box, 1) != self._factors.get(box, 1))
+        self._blocked = blocked
+        self._factors = factors
+        self._version = self.mesh.get("version", 0)
+
+        offsets, neighbors = self._offsets, self._neighbors
+        for box in changed:
+            self._update(box)
+            for e in range(offsets[box], offsets[box + 1]):
+                self._update(neighbors[e])
+
+    def _cost(self, a, b, cost):
+        if a in self._blocked or b in self._blocked:
+            return inf
+        factors = self._factors
+        if factors:
+            return cost * max(factors.get(a, 1), factors.get(b, 1))
+        return cost
+
+    def _key(self, box):
+        g = min(self.g.get(box, inf), self.rhs.get(box, inf))
+        # Off the mesh there is no box to aim at; a zero heuristic keeps the queued keys lower bounds
+        h = 0 if self.start is None else _distance(self._bounds, self.start, box)
+        return (g + h + self._km, g)
+
+    def _push(self, box):
+        key = self._key(box)
+        self._keys[box] = key
+        heappush(self._frontier, (key, box))
+        if self.stats is not None:
+            self.stats.pushes += 1
+
+    def _update(self, box):
+        # Recomputes rhs from the successors and (re)queues the box if it became inconsistent
+        if box != self.goal:
+            offsets, neighbors, costs = self._offsets, self._neighbors, self._costs
+            best = inf
+            for e in range(offsets[box], offsets[box + 1]):
+                neighbor = neighbors[e]
+                cost = self._cost(box, neighbor, costs[e]) + self.g.get(neighbor, inf)
+                if cost < best:
+                    best = cost
+            self.rhs[box] = best
+        if self.g.get(box, inf) != self.rhs.get(box, inf):
+            self._push(box)
+        else:
+            self._keys.pop(box, None)
+
+    def _compute(self):
+        # Expands inconsistent boxes until the agent's box is consistent and nothing cheaper is queued
+        frontier, keys, g, rhs = self._frontier, self._keys, self.g, self.rhs
+        offsets, neighbors = self._offsets, self._neighbors
+        start = self.start
+        expanded = 0
+        while frontier:
+            key, box = frontier[0]
+            if keys.get(box) != key:
+                # Stale entry: the box was requeued with another key or became consistent
+                heappop(frontier)
+                continue
+            if not (key < self._key(start) or rhs.get(start, inf) != g.get(start, inf)):
+                break
+            heappop(frontier)
+
+            new_key = self._key(box)
+            if key < new_key:
+                self._push(box)
+                continue
+            del keys[box]
+            expanded += 1
+
+            if g.get(box, inf) > rhs.get(box, inf):
+                g[box] = rhs[box]
+                for e in range(offsets[box], offsets[box + 1]):
+                    self._update(neighbors[e])
+            else:
+                g[box] = inf
+                self._update(box)
+                for e in range(offsets[box], offsets[box + 1]):
+                    self._update(neighbors[e])
+
+        self.expanded += expanded
+        if self.stats is not None:
+            self.stats.expanded += expanded
@@ -0,0 +1,280 @@
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+from numbers import Integral
+
+from nm_cache import corridor_cache
+from nm_mesh import build_index, compact_mesh, load_mesh, load_pickle
+from nm_pathfinder import component_labels, find_path, find_paths
+
+# Meshes of this process (a server worker), by name, and a lock for each: a mesh holds
+# unsynchronized state (the corridor cache, the line of sight memo, lazily built views and
+# index), so threads serving connections in-process take turns on it
+_meshes = {}
+_locks = {}
+
+
+def open_mesh(spec):
+    # A mesh pickle, or the prefix of a compact mesh written by nm_mesh.save_mesh (memory-mapped).
+    # Either way the mesh knows its file, so a hierarchy built with nm_hierarchy.py is read from its cache.
+    if spec.endswith('.pickle'):
+        mesh = load_pickle(spec)
+        compact_mesh(mesh)
+    else:
+        mesh = load_mesh(spec)
+    # Build the lazy lookups now rather than on the first request
+    component_labels(mesh)
+    if "index" not in mesh:
+        build_index(mesh)
+    return mesh
+
+
+def load_meshes(specs):
+    """
+    Loads the server's meshes into this process
+
+    Args:
+        specs: {name: mesh pickle or compact prefix}
+    """
+    _meshes.clear()
+    _locks.clear()
+    for name, spec in specs.items():
+        _meshes[name] = open_mesh(spec)
+        _locks[name] = threading.Lock()
+
+
+def handle(request):
+    """
+    Answers one request
+
+    Requests are dicts with an optional "id" (echoed back) and "mesh" name
+    (default "default"), and either
+      "source" and "destination" points, answered like find_path with
+      "heuristic", "hierarchical", "smooth", "any_angle" and "cache" (default true) options, or
+      "pairs" of [source, destination], answered like find_paths, or
+      "op": "ping" or "meshes".
+
+    Returns:
+        The response dict: "path" and "boxes", "results" (a list of those) for
+        "pairs", or "error" with a message
+    """
+    response = {"id": request.get("id")}
+    op = request.get("op")
+    if op == "ping":
+        response["pong"] = True
+        return response
+    if op == "meshes":
+        response["meshes"] = {name: len(mesh["bounds"]) for name, mesh in _meshes.items()}
+        return response
+    if op is not None:
+        response["error"] = "unknown op: %s" % op
+        return response
+
+    name = request.get("mesh", "default")
+    mesh = _meshes.get(name)
+    if mesh is None:
+        response["error"] = "unknown mesh: %s" % name
+        return response
+
+    with _locks[name]:
+        _answer(request, mesh, response)
+    return response
+
+
+def _answer(request, mesh, response):
+    # Fills in the response to a path request
+    if "pairs" in request:
+        pairs = [(tuple(source), tuple(destination)) for source, destination in request["pairs"]]
+        results = find_paths(pairs, mesh, smooth=request.get("smooth", False))
+        response["results"] = [_result(path, boxes) for path, boxes in results]
+    elif "source" in request and "destination" in request:
+        path, boxes = find_path(tuple(request["source"]), tuple(request["destination"]), mesh,
+                                heuristic=request.get("heuristic", "euclidean"),
+                                hierarchical=request.get("hierarchical", False),
+                                smooth=request.get("smooth", False),
+                                any_angle=request.get("any_angle", False),
+                                cache=corridor_cache(mesh) if request.get("cache", True) else None)
+        response.update(_result(path, boxes))
+    else:
+        response["error"] = "a request needs source and destination, pairs, or op"
+
+
+def _result(path, boxes):
+    return {"path": [[_number(x), _number(y)] for x, y in path], "boxes": [[int(v) for v in box] for box in boxes]}
+
+
+def _number(value):
+    # Points come back exactly as find_path gives them; only NumPy scalars need converting for json
+    return int(value) if isinstance(value, Integral) else float(value)
+
+
+# Compact JSON for every response line
+SEPARATORS = (',', ':')
+
+
+def handle_line(line):
+    """ Parses one NDJSON request line and returns its response line (without the newline). """
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("a request must be a JSON object")
+    except ValueError as error:
+        return json.dumps({"id": None, "error": "bad request: %s" % error}, separators=SEPARATORS)
+    try:
+        response = handle(request)
+    except Exception as error:
+        response = {"id": request.get("id"), "error": "%s: %s" % (type(error).__name__, error)}
+    return json.dumps(response, separators=SEPARATORS)
+
+
+class PathServer:
+    """ Answers newline-delimited JSON path requests against meshes loaded once.
+
+    With processes, requests go to a pool of worker processes that each
+    load the meshes at start-up (compact meshes are memory-mapped, so the
+    workers share their pages). Requests are pipelined: a client may send
+    any number of lines without waiting, and each response line is written
+    as soon as its request finishes, so responses can come back out of
+    order; match them up by "id". Without processes, requests are answered
+    in order on the reading thread, and connections served at the same time
+    take turns on each mesh.
+    """
+
+    def __init__(self, specs, processes=None, max_pending=1024):
+        """
+        Args:
+            specs: {name: mesh pickle or compact prefix}; requests default to the mesh named "default"
+            processes: worker processes; None or 0 answers requests in this process
+            max_pending: requests a connection may have in flight before reading pauses
+        """
+        self.max_pending = max_pending
+        self.pool = None
+        if processes:
+            from multiprocessing import Pool
+            self.pool = Pool(processes, initializer=load_meshes, initargs=(specs,))
+        else:
+            load_meshes(specs)
+
+    def serve(self, lines, write):
+        """
+        Answers every request line from an iterable (a file, a socket's rfile)
+
+        Args:
+            lines: iterable of request lines
+            write: called with each response line, from the pool's result thread when there is a pool
+
+        Returns:
+            The number of requests answered
+        """
+        if self.pool is None:
+            count = 0
+            for line in lines:
+                if line.strip():
+                    write(handle_line(line))
+                    count += 1
+            return count
+
+        # Requests in flight, bounded so a fast client cannot queue up unlimited work
+        done = threading.Condition()
+        counts = {"outstanding": 0, "answered": 0}
+
+        def finished(line):
+            write(line)
+            with done:
+                counts["outstanding"] -= 1
+                counts["answered"] += 1
+                done.notify_all()
+
+        def failed(error):
+            response = {"id": None, "error": "%s: %s" % (type(error).__name__, error)}
+            finished(json.dumps(response, separators=SEPARATORS))
+
+        for line in lines:
+            if line.strip():
+                with done:
+                    done.wait_for(lambda: counts["outstanding"] < self.max_pending)
+                    counts["outstanding"] += 1
+                self.pool.apply_async(handle_line, (line,), callback=finished, error_callback=failed)
+        with done:
+            done.wait_for(lambda: counts["outstanding"] == 0)
+        return counts["answered"]
+
+    def serve_stdio(self):
+        lock = threading.Lock()
+
+        def write(line):
+            with lock:
+                sys.stdout.write(line + '\n')
+                sys.stdout.flush()
+
+        return self.serve(sys.stdin, write)
+
+    def serve_unix(self, path):
+        """ Listens on a Unix socket; every connection is served on its own thread, all sharing the pool. """
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                lock = threading.Lock()
+
+                def write(line):
+                    with lock:
+                        try:
+                            self.wfile.write((line + '\n').encode())
+                            self.wfile.flush()
+                        except OSError:
+                            # The client went away; the remaining answers have nowhere to go
+                            pass
+
+                server.serve((line.decode() for line in self.rfile), write)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+            unix_server.daemon_threads = True
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.unlink(path)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {}
+    for flag in ('--socket', '--processes'):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+
+    if len(args) < 1:
+        print("Usage: python nm_server.py [name=]mesh.pickle|prefix ... [--processes N] [--socket PATH]",
+              file=sys.stderr)
+        exit(1)
+
+    specs = {}
+    for arg in args:
+        name, _, spec = arg.rpartition('=')
+        specs[name or ("default" if not specs else os.path.basename(spec))] = spec
+
+    # Exit through the finally blocks (socket file, pool) on a plain kill as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    path_server = PathServer(specs, int(options.get('--processes', 0)))
+    try:
+        if '--socket' in options:
+            path_server.serve_unix(options['--socket'])
+        else:
+            path_server.serve_stdio()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        path_server.close()
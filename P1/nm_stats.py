@@ -0,0 +1,67 @@
+import json
+from time import perf_counter
+
+
+class SearchStats:
+    """ Counters and timings collected by the pathfinder when a stats object is passed in.
+
+    One object can be handed to any number of queries (or merged with
+    others) to aggregate them. With trace=True every find_path query also
+    appends a small record of its own to records.
+    """
+
+    __slots__ = ("queries", "found", "expanded", "pushes", "reopened", "path_boxes", "path_length",
+                 "times", "records")
+
+    def __init__(self, trace=False):
+        self.queries = 0            # find_path calls
+        self.found = 0              # queries that returned a path
+        self.expanded = 0           # boxes taken off a frontier and expanded
+        self.pushes = 0             # frontier (heap) pushes
+        self.reopened = 0           # pushes for boxes already reached, after a cheaper route was found
+        self.path_boxes = 0         # boxes on the returned corridors
+        self.path_length = 0.0      # euclidean length of the returned point paths
+        self.times = {}             # phase -> seconds
+        self.records = [] if trace else None
+
+    def lap(self, phase, since):
+        """ Adds the time elapsed since `since` (a perf_counter value) to phase and returns the current time. """
+        now = perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - since
+        return now
+
+    def record(self, **fields):
+        """ Appends a per-query record when tracing. """
+        if self.records is not None:
+            self.records.append(fields)
+
+    def merge(self, other):
+        """ Adds another SearchStats into this one and returns self. """
+        self.queries += other.queries
+        self.found += other.found
+        self.expanded += other.expanded
+        self.pushes += other.pushes
+        self.reopened += other.reopened
+        self.path_boxes += other.path_boxes
+        self.path_length += other.path_length
+        for phase, seconds in other.times.items():
+            self.times[phase] = self.times.get(phase, 0.0) + seconds
+        if self.records is not None and other.records is not None:
+            self.records.extend(other.records)
+        return self
+
+    __iadd__ = merge
+
+    def as_dict(self):
+        stats = {name: getattr(self, name) for name in self.__slots__ if name != "records"}
+        stats["times"] = dict(self.times)
+        if self.records is not None:
+            stats["records"] = list(self.records)
+        return stats
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __repr__(self):
+        return "SearchStats(%s)" % ", ".join(
+            "%s=%r" % (name, getattr(self, name)) for name in self.__slots__ if name != "records")
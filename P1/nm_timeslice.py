@@ -0,0 +1,218 @@
+from collections import deque
+from math import inf
+from time import perf_counter
+
+from nm_pathfinder import (_a_star_bi_steps, _distance, _is_blocked, _locate, _reconstruct, component_labels,
+                           euclidean_distance)
+from nm_mesh import views
+
+
+class PathSearch:
+    """ A find_path query that runs a slice at a time.
+
+    The search is the same bidirectional A* as find_path and gives the same
+    result; step() just stops after a budget of expansions or seconds and
+    picks up from the same frontiers on the next call.
+
+    state is "running" until the search ends as "found" or "failed" (no
+    path), or is cancelled.
+    """
+
+    def __init__(self, mesh, source_point, destination_point, heuristic="euclidean", smooth=False, stats=None):
+        """
+        Args:
+            mesh: pathway constraints the path adheres to
+            source_point: starting point of the pathfinder
+            destination_point: the ultimate goal the pathfinder must reach
+            heuristic: "euclidean" or "alt", as for find_path
+            smooth: pull the path tight through the corridor's portals, as for find_path
+            stats: optional nm_stats.SearchStats that collects counters and phase timings
+        """
+        self.mesh = mesh
+        self.source_point = source_point
+        self.destination_point = destination_point
+        self.smooth = smooth
+        self.stats = stats
+        self.state = "running"
+        self.expanded = 0
+        self.steps = 0
+        self.elapsed = 0.0
+        self.path = []
+        self.boxes = {}.keys()
+
+        if stats is not None:
+            stats.queries += 1
+            clock = perf_counter()
+        self.source_id = _locate(mesh, source_point)
+        self.destination_id = _locate(mesh, destination_point)
+        if stats is not None:
+            stats.lap("locate", clock)
+
+        self._last = [self.source_id, self.destination_id]
+        self._gap = inf
+        self._steps = None
+        if (self.source_id is None) or (self.destination_id is None):
+            self.state = "failed"
+        elif component_labels(mesh)[self.source_id] != component_labels(mesh)[self.destination_id]:
+            self.state = "failed"
+        elif _is_blocked(mesh, self.source_id) or _is_blocked(mesh, self.destination_id):
+            self.state = "failed"
+        else:
+            self._steps = _a_star_bi_steps(mesh, self.source_id, self.destination_id, heuristic, stats)
+
+    @property
+    def done(self):
+        return self.state != "running"
+
+    def step(self, max_expansions=None, max_time=None):
+        """
+        Advances the search until it ends or the budget runs out
+
+        Args:
+            max_expansions: most boxes to expand in this step
+            max_time: most seconds to spend in this step (checked after every expansion)
+
+        Returns:
+            True when the search is over (see state)
+        """
+        if self.done:
+            return True
+
+        start = perf_counter()
+        deadline = None if max_time is None else start + max_time
+        limit = None if max_expansions is None else self.expanded + max_expansions
+        steps, last = self._steps, self._last
+        finished = False
+        try:
+            while limit is None or self.expanded < limit:
+                side, box = next(steps)
+                last[side] = box
+                self.expanded += 1
+                if deadline is not None and perf_counter() >= deadline:
+                    break
+        except StopIteration as stop:
+            finished = True
+            parent_dict = stop.value
+
+        now = perf_counter()
+        self.steps += 1
+        self.elapsed += now - start
+        if self.stats is not None:
+            self.stats.lap("search", start)
+        if finished:
+            self._steps = None
+            self._finish(parent_dict)
+            if self.stats is not None:
+                self.stats.lap("reconstruct", now)
+        else:
+            bounds = views(self.mesh)["bounds"]
+            self._gap = min(self._gap, _distance(bounds, last[0], last[1]))
+        return self.done
+
+    def run(self):
+        """ Runs the search to the end and returns (path, boxes), as find_path does. """
+        self.step()
+        return self.result
+
+    def cancel(self):
+        """ Stops the search; it keeps what it had expanded in its stats but finds no path. """
+        if not self.done:
+            self._steps.close()
+            self._steps = None
+            self.state = "cancelled"
+
+    @property
+    def result(self):
+        """ (path, boxes) as find_path returns them; empty until the search is found. """
+        return self.path, self.boxes
+
+    @property
+    def progress(self):
+        """
+        How far along the search is: boxes expanded, steps taken, seconds spent, and
+        an estimate in [0, 1] of how close the two frontiers have come to meeting
+        (1 - smallest straight-line gap between their latest boxes after a step /
+        gap between the endpoints)
+        """
+        estimate = 1.0 if self.state == "found" else 0.0
+        if self.state == "running" and self._gap < inf:
+            total = _distance(views(self.mesh)["bounds"], self.source_id, self.destination_id)
+            if total > 0:
+                estimate = max(0.0, 1.0 - self._gap / total)
+        return {"state": self.state, "expanded": self.expanded, "steps": self.steps, "elapsed": self.elapsed,
+                "estimate": estimate}
+
+    def _finish(self, parent_dict):
+        if parent_dict is None:
+            self.state = "failed"
+            return
+        path, boxes = _reconstruct(self.mesh, parent_dict, self.source_id, self.destination_id,
+                                   self.source_point, self.destination_point, self.smooth)
+        self.path, self.boxes = path, boxes.keys()
+        self.state = "found"
+        if self.stats is not None:
+            self.stats.found += 1
+            self.stats.path_boxes += len(boxes)
+            self.stats.path_length += sum(euclidean_distance(a, b) for a, b in zip(path, path[1:]))
+
+
+class SearchQueue:
+    """ Round-robins many in-flight PathSearch objects within a per-frame budget.
+
+    Each tick() gives the searches turns of up to slice_expansions boxes,
+    starting where the previous tick left off, until the frame's budget is
+    used up or every search has had its turn.
+    """
+
+    def __init__(self, slice_expansions=64):
+        """
+        Args:
+            slice_expansions: boxes one search may expand per turn
+        """
+        self.slice_expansions = slice_expansions
+        self.pending = deque()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, search):
+        """ Queues a PathSearch and returns it. """
+        if not search.done:
+            self.pending.append(search)
+        return search
+
+    def tick(self, max_expansions=None, max_time=None):
+        """
+        Spends one frame's budget on the queued searches
+
+        Args:
+            max_expansions: most boxes to expand over all searches in this tick
+            max_time: most seconds to spend in this tick
+
+        Returns:
+            The searches that ended (found, failed or cancelled) during this tick
+        """
+        finished = []
+        start = perf_counter()
+        expanded = 0
+        for _ in range(len(self.pending)):
+            search = self.pending.popleft()
+            if search.done:
+                finished.append(search)
+                continue
+
+            budget = self.slice_expansions
+            if max_expansions is not None:
+                budget = min(budget, max_expansions - expanded)
+            remaining = None if max_time is None else max_time - (perf_counter() - start)
+            if budget <= 0 or (remaining is not None and remaining <= 0):
+                self.pending.appendleft(search)
+                break
+
+            before = search.expanded
+            if search.step(budget, remaining):
+                finished.append(search)
+            else:
+                self.pending.append(search)
+            expanded += search.expanded - before
+        return finished
@@ -2,10 +2,14 @@
 from mcts_node import MCTSNode
 from random import choice
 from math import sqrt, log
+from timeit import default_timer as time
+
+import mcts_parallel
 
 #import p2_t3
 
 num_nodes = 1000
+num_workers = 1  # More than 1 runs think() root-parallel across processes
 explore_faction = 2.
 
 def traverse_nodes(node, board, state, identity):
@@ -29,13 +33,14 @@ def traverse_nodes(node, board, state, identity):
 
         num=0
         bestnode=node
+        log_visits=log(node.visits)
 
         #go through each node and find the optimal one
         for x in node.child_nodes:
             #get node
             current=node.child_nodes[x]
             #get number
-            num_current=(current.wins / current.visits) + (explore_faction * sqrt( log(node.visits )/ current.visits) )
+            num_current=(current.wins / current.visits) + (explore_faction * sqrt( log_visits / current.visits) )
 
             #if node has no children then go to next node to search --old fix for the recursive loop--
             #if len(current.child_nodes)==0 and len(current.untried_actions)==0:
@@ -111,30 +116,30 @@ def rollout(board, state):
         The win values of the final state after performing the rollout.
     """
 
+    # Play on a mutable copy of the state: moves are applied (and taken back) in place
+    rollout_state = board.rollout_state(state)
+
     # Check if the game has already ended
-    if board.is_ended(state):
-        return board.win_values(state)
+    if rollout_state.is_ended():
+        return rollout_state.win_values()
 
     # Get the current player
-    current_player = board.current_player(state)
+    current_player = rollout_state.current_player()
 
     # Check if the current player has an instant win move
-    legal_actions = board.legal_actions(state)
-    for action in legal_actions:
-        new_state = board.next_state(state, action)
-        win_values = board.win_values(new_state)
+    for action in rollout_state.legal_actions():
+        rollout_state.apply(action)
+        win_values = rollout_state.win_values()
+        rollout_state.undo()
         if win_values and win_values[current_player] == 1:
             return win_values
 
     # Perform a heuristic rollout
-    owned_boxes = board.owned_boxes(state)
-
-    while not board.is_ended(state):
+    while not rollout_state.is_ended():
         # Choose a random action
-        action = choice(board.legal_actions(state))
-        state = board.next_state(state, action)
+        rollout_state.apply(choice(rollout_state.legal_actions()))
 
-    return board.win_values(state)
+    return rollout_state.win_values()
 
 
 
@@ -161,21 +166,30 @@ def backpropagate(node, won):
 
 
 
-def think(board, state):
+def build_tree(board, state, iterations=None, seconds=None):
     """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
 
     Args:
-        board:  The game setup.
-        state:  The state of the game.
+        board:       The game setup.
+        state:       The state of the game.
+        iterations:  Number of sampled games (num_nodes if None).
+        seconds:     Wall-clock budget; when given, sampling stops once it is spent.
 
-    Returns:    The action to be taken.
+    Returns:    The root node of the tree.
 
     """
     identity_of_bot = board.current_player(state)
 
     root_node = MCTSNode(parent=None, parent_action=None, action_list=board.legal_actions(state))
 
-    for step in range(num_nodes):
+    if iterations is None and seconds is None:
+        iterations = num_nodes
+    deadline = None if seconds is None else time() + seconds
+
+    step = 0
+    while (iterations is None or step < iterations) and (deadline is None or time() < deadline):
+        step += 1
+
         # Copy the game for sampling a playthrough
         sampled_game = state
 
@@ -193,29 +207,72 @@ def think(board, state):
         #backpropagate winner
         backpropagate(node, win_num[identity_of_bot])
 
+    return root_node
+
+
+def root_statistics(root_node):
+    """ The (wins, visits) of each action at the root, as think() compares them. """
+    return dict(
+        (action, (child.wins, child.visits)) for action, child in root_node.child_nodes.items()
+    )
+
+
+def best_action(statistics):
+    """ Picks the action with the best win rate from {action: (wins, visits)}. """
+
     #now the best move needs to be found
     bestmove=()
     bestwin=0
  
-    for x in root_node.child_nodes:
-        #get current node and find its win rate
-        current=root_node.child_nodes[x]
+    for x in statistics:
+        #get the current action's totals and find its win rate
+        wins, visits = statistics[x]
 
         #find the win rate
-        current_win=current.wins/current.visits
+        current_win=wins/visits
 
-        #find any instant lose moves for opponent
-     
-
-        # if new best win rate is found and if there are less instant lose moves
+        # if new best win rate is found
         if current_win >= bestwin :
             #update bestwin
             bestwin=current_win
             #update bestmove
             bestmove=x
 
+    return bestmove
 
 
+def think(board, state):
+    """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
+
+    Args:
+        board:  The game setup.
+        state:  The state of the game.
+
+    Returns:    The action to be taken.
+
+    """
+    if num_workers > 1:
+        return think_parallel(board, state)
+
     # Return an action, typically the most frequently used action (from the root) or the action with the best
     # estimated win rate.
-    return bestmove
+    return best_action(root_statistics(build_tree(board, state)))
+
+
+def think_parallel(board, state, workers=None, iterations=None, seconds=None):
+    """ Root-parallel MCTS: independent trees in worker processes, their root statistics merged.
+
+    Args:
+        board:       The game setup.
+        state:       The state of the game.
+        workers:     Worker processes (num_workers if None).
+        iterations:  Total sampled games, split between the workers (num_nodes if None and no seconds).
+        seconds:     Wall-clock budget for every worker instead.
+
+    Returns:    The action to be taken.
+
+    """
+    workers = num_workers if workers is None else workers
+    if iterations is None and seconds is None:
+        iterations = num_nodes
+    return best_action(mcts_parallel.root_parallel(__name__, board, state, workers, iterations, seconds))
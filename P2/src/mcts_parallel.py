@@ -0,0 +1,85 @@
+import atexit
+import importlib
+import random
+from multiprocessing import Pool
+
+# The worker processes, started on first use and kept for every later move. Where workers are
+# spawned rather than forked (Windows, macOS) they import the main script again, so its game
+# loop must sit under if __name__ == '__main__' (as in p2_sim and p2_play).
+_pool = None
+_pool_size = 0
+
+# Search settings of the bot modules, copied into every task: spawned workers start from the
+# module defaults, and even forked ones miss changes made after the pool started
+settings = ("num_nodes", "explore_faction", "virtual_loss", "batch_leaves")
+
+
+def pool(workers):
+    """ The shared worker pool, (re)started when a different number of workers is asked for. """
+    global _pool, _pool_size
+    if _pool is None or _pool_size != workers:
+        close()
+        _pool = Pool(workers)
+        _pool_size = workers
+    return _pool
+
+
+def close():
+    """ Stops the worker processes, if any. """
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool, _pool_size = None, 0
+
+
+atexit.register(close)
+
+
+def _search(task):
+    # Runs in a worker: one independent tree from the shared root, reported as its root statistics
+    module_name, values, board, state, iterations, seconds, seed = task
+    module = importlib.import_module(module_name)
+    for name, value in values.items():
+        setattr(module, name, value)
+    random.seed(seed)
+    if getattr(module, "batch_leaves", 1) > 1:
+        # Root and tree parallelism combined: each worker batches the playouts of its own tree
+        root_node = module.build_tree_batched(board, state, iterations, seconds)
+    else:
+        root_node = module.build_tree(board, state, iterations, seconds)
+    return module.root_statistics(root_node)
+
+
+def merge(statistics):
+    """ Sums the {action: (wins, visits)} root statistics of several trees. """
+    merged = {}
+    for tree in statistics:
+        for action, (wins, visits) in tree.items():
+            total_wins, total_visits = merged.get(action, (0, 0))
+            merged[action] = (total_wins + wins, total_visits + visits)
+    return merged
+
+
+def root_parallel(module_name, board, state, workers, iterations=None, seconds=None, seed=None):
+    """ Root-parallel MCTS: every worker builds its own tree from state, then the root statistics are merged.
+
+    Args:
+        module_name:  The bot module whose build_tree and root_statistics the workers run.
+        board:        The game setup.
+        state:        The state of the game.
+        workers:      Number of worker processes (and trees).
+        iterations:   Total sampled games, split evenly between the trees.
+        seconds:      Wall-clock budget of every tree, instead of or as well as iterations.
+        seed:         Seed of the first tree; the others use the following seeds (random if None).
+
+    Returns:    The merged {action: (wins, visits)} of the root's children.
+
+    """
+    if seed is None:
+        seed = random.getrandbits(32)
+    module = importlib.import_module(module_name)
+    values = dict((name, getattr(module, name)) for name in settings if hasattr(module, name))
+    share = None if iterations is None else -(-iterations // workers)
+    tasks = [(module_name, values, board, state, share, seconds, seed + i) for i in range(workers)]
+    return merge(pool(workers).map(_search, tasks))
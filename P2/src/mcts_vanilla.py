@@ -1,21 +1,29 @@
 
 from mcts_node import MCTSNode
-from random import choice
+from random import choice, getrandbits
 from math import sqrt, log
+from timeit import default_timer as time
+
+import mcts_parallel
 
 #import p2_t3
 
 num_nodes = 1000
+num_workers = 1  # More than 1 runs think() root-parallel across processes
+batch_leaves = 1  # More than 1 runs think() tree-parallel, playing out that many leaves at once
+virtual_loss = 1  # Visits (with no wins) a pending descent adds to its path in tree-parallel mode
 explore_faction = 2.
 
-def traverse_nodes(node, board, state, identity):
+def traverse_nodes(node, board, state, identity, virtual_loss=0):
     """ Traverses the tree until the end criterion are met.
 
     Args:
-        node:       A tree node from which the search is traversing.
-        board:      The game setup.
-        state:      The state of the game.
-        identity:   The bot's identity, either 'red' or 'blue'.
+        node:           A tree node from which the search is traversing.
+        board:          The game setup.
+        state:          The state of the game.
+        identity:       The bot's identity, either 'red' or 'blue'.
+        virtual_loss:   Lost visits to add to every node on the path, so that other
+                        pending descents are steered away from it (see backpropagate).
 
     Returns:        A node from which the next stage of the search can proceed.
 
@@ -23,19 +31,22 @@ def traverse_nodes(node, board, state, identity):
 
     #will need something to detect if all nodes have been searched
 
+    #count this descent as a loss until its result comes back
+    node.visits += virtual_loss
 
     #if no more unexplored actions
     if( len(node.untried_actions)==0 ):
 
         num=0
         bestnode=node
+        log_visits=log(node.visits)
 
         #go through each node and find the optimal one
         for x in node.child_nodes:
             #get node
             current=node.child_nodes[x]
             #get number
-            num_current=(current.wins / current.visits) + (explore_faction * sqrt( log(node.visits )/ current.visits) )
+            num_current=(current.wins / current.visits) + (explore_faction * sqrt( log_visits / current.visits) )
 
             #if node has no children then go to next node to search --old fix for the recursive loop--
             #if len(current.child_nodes)==0 and len(current.untried_actions)==0:
@@ -53,7 +64,7 @@ def traverse_nodes(node, board, state, identity):
             return bestnode,state
 
         state=board.next_state(state, bestnode.parent_action)
-        return traverse_nodes(bestnode, board, state, identity) 
+        return traverse_nodes(bestnode, board, state, identity, virtual_loss) 
             
 
 
@@ -66,6 +77,7 @@ def traverse_nodes(node, board, state, identity):
 
         #add child to current node
         node.child_nodes[node.untried_actions[0]]=child
+        child.visits += virtual_loss
 
         #pop action from list
         node.untried_actions.pop(0)
@@ -109,17 +121,20 @@ def rollout(board, state):
 
     """
 
+    #play on a mutable copy of the state, applying moves in place
+    rollout_state = board.rollout_state(state)
+
     #goes until game is ended
-    while( not board.is_ended(state)):
+    while( not rollout_state.is_ended()):
 
         #choose arndom action
-        action = choice( board.legal_actions(state) )
+        action = choice( rollout_state.legal_actions() )
    
         # go to next state
-        state=board.next_state(state, action)
+        rollout_state.apply(action)
 
     #return who won
-    return board.win_values(state)
+    return rollout_state.win_values()
 
     
 
@@ -128,12 +143,13 @@ def rollout(board, state):
 
 
 
-def backpropagate(node, won):
+def backpropagate(node, won, virtual_loss=0):
     """ Navigates the tree from a leaf node to the root, updating the win and visit count of each node along the path.
 
     Args:
-        node:   A leaf node.
-        won:    An indicator of whether the bot won or lost the game.
+        node:           A leaf node.
+        won:            An indicator of whether the bot won or lost the game.
+        virtual_loss:   The virtual loss traverse_nodes added to the path, taken back here.
 
     """
 
@@ -143,29 +159,38 @@ def backpropagate(node, won):
         #add won to win
         #won will be 1 if its a win and 0 if a loss
         node.wins+=won
-        #add 1 to visit
-        node.visits+=1
+        #add 1 to visit, less the virtual loss
+        node.visits+=1-virtual_loss
         
         #recurse
-        backpropagate(node.parent,won)
+        backpropagate(node.parent,won,virtual_loss)
 
 
 
-def think(board, state):
+def build_tree(board, state, iterations=None, seconds=None):
     """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
 
     Args:
-        board:  The game setup.
-        state:  The state of the game.
+        board:       The game setup.
+        state:       The state of the game.
+        iterations:  Number of sampled games (num_nodes if None).
+        seconds:     Wall-clock budget; when given, sampling stops once it is spent.
 
-    Returns:    The action to be taken.
+    Returns:    The root node of the tree.
 
     """
     identity_of_bot = board.current_player(state)
 
     root_node = MCTSNode(parent=None, parent_action=None, action_list=board.legal_actions(state))
 
-    for step in range(num_nodes):
+    if iterations is None and seconds is None:
+        iterations = num_nodes
+    deadline = None if seconds is None else time() + seconds
+
+    step = 0
+    while (iterations is None or step < iterations) and (deadline is None or time() < deadline):
+        step += 1
+
         # Copy the game for sampling a playthrough
         sampled_game = state
 
@@ -183,29 +208,127 @@ def think(board, state):
         #backpropagate winner
         backpropagate(node, win_num[identity_of_bot])
 
+    return root_node
+
+
+def build_tree_batched(board, state, iterations=None, seconds=None, leaves=None):
+    """ Tree-parallel MCTS: descents share one tree and their playouts run together on p2_batch.
+
+    Each round makes up to leaves descents with virtual loss, so that they spread over
+    different leaves, plays all their games out at once with p2_batch.batch_rollout and
+    backpropagates the results, taking the virtual loss back.
+
+    Args:
+        board:       The game setup.
+        state:       The state of the game.
+        iterations:  Number of sampled games (num_nodes if None).
+        seconds:     Wall-clock budget; when given, sampling stops once it is spent.
+        leaves:      Descents per batch (batch_leaves if None).
+
+    Returns:    The root node of the tree.
+
+    """
+    import numpy as np
+    import p2_batch
+
+    identity_of_bot = board.current_player(state)
+
+    root_node = MCTSNode(parent=None, parent_action=None, action_list=board.legal_actions(state))
+
+    if iterations is None and seconds is None:
+        iterations = num_nodes
+    leaves = batch_leaves if leaves is None else leaves
+    if leaves > 1 and virtual_loss < 1:
+        # Later descents of a batch would reach children with no visits yet: log(0) in traverse_nodes
+        raise ValueError("tree-parallel search needs virtual_loss >= 1, not %r" % virtual_loss)
+    deadline = None if seconds is None else time() + seconds
+    rng = np.random.default_rng(getrandbits(64))
+
+    step = 0
+    while (iterations is None or step < iterations) and (deadline is None or time() < deadline):
+        size = leaves if iterations is None else min(leaves, iterations - step)
+        step += size
+
+        #find new nodes, each descent steering the next ones away with its virtual loss
+        batch = [traverse_nodes(root_node, board, state, identity_of_bot, virtual_loss) for _ in range(size)]
+
+        #rollout from all of them at once
+        win_nums = p2_batch.batch_rollout([sampled_game for node, sampled_game in batch], rng)
+
+        #backpropagate winners
+        for (node, sampled_game), win_num in zip(batch, win_nums):
+            backpropagate(node, win_num[identity_of_bot - 1], virtual_loss)
+
+    return root_node
+
+
+def root_statistics(root_node):
+    """ The (wins, visits) of each action at the root, as think() compares them. """
+    return dict(
+        (action, (child.wins, child.visits)) for action, child in root_node.child_nodes.items()
+    )
+
+
+def best_action(statistics):
+    """ Picks the action with the best win rate from {action: (wins, visits)}. """
+
     #now the best move needs to be found
     bestmove=()
     bestwin=0
  
-    for x in root_node.child_nodes:
-        #get current node and find its win rate
-        current=root_node.child_nodes[x]
+    for x in statistics:
+        #get the current action's totals and find its win rate
+        wins, visits = statistics[x]
 
         #find the win rate
-        current_win=current.wins/current.visits
+        current_win=wins/visits
 
-        #find any instant lose moves for opponent
-     
-
-        # if new best win rate is found and if there are less instant lose moves
+        # if new best win rate is found
         if current_win >= bestwin :
             #update bestwin
             bestwin=current_win
             #update bestmove
             bestmove=x
 
+    return bestmove
+
 
+def think(board, state):
+    """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
+
+    Args:
+        board:  The game setup.
+        state:  The state of the game.
+
+    Returns:    The action to be taken.
+
+    """
+    if num_workers > 1:
+        return think_parallel(board, state)
+    if batch_leaves > 1:
+        return best_action(root_statistics(build_tree_batched(board, state)))
 
     # Return an action, typically the most frequently used action (from the root) or the action with the best
     # estimated win rate.
-    return bestmove
+    return best_action(root_statistics(build_tree(board, state)))
+
+
+def think_parallel(board, state, workers=None, iterations=None, seconds=None):
+    """ Root-parallel MCTS: independent trees in worker processes, their root statistics merged.
+
+    With batch_leaves > 1 as well, every worker builds its tree with build_tree_batched.
+
+    Args:
+        board:       The game setup.
+        state:       The state of the game.
+        workers:     Worker processes (num_workers if None).
+        iterations:  Total sampled games, split between the workers (num_nodes if None and no seconds).
+        seconds:     Wall-clock budget for every worker instead.
+
+    Returns:    The action to be taken.
+
+    """
+    workers = num_workers if workers is None else workers
+    if iterations is None and seconds is None:
+        iterations = num_nodes
+    return best_action(mcts_parallel.root_parallel(__name__, board, state, workers, iterations, seconds))
@@ -0,0 +1,133 @@
+import numpy as np
+
+from p2_t3 import cell_table, full_table, win_table
+
+# The board tables of p2_t3 as arrays, indexed by 9-bit masks
+win_array = np.array(win_table, dtype=bool)
+full_array = np.array(full_table, dtype=bool)
+popcount_array = np.array([len(cells) for cells in cell_table], dtype=np.int64)
+
+# select_array[m, k] is the k-th set cell of mask m
+select_array = np.zeros((512, 9), dtype=np.int64)
+for _mask, _cells in enumerate(cell_table):
+    select_array[_mask, :len(_cells)] = _cells
+
+_boards = np.arange(9)
+
+
+def pack_states(states):
+    """ Packs state tuples (see p2_t3.Board) into the arrays the batch engine plays on.
+
+    Args:
+        states:     A sequence of state tuples.
+
+    Returns:        (marks, big, constraint, player): the (n, 18) board bitmasks, the (n, 2)
+                    won or full sub-boards of each player, the (n,) required sub-board
+                    (-1 for any) and the (n,) player to move.
+
+    """
+    n = len(states)
+    marks = np.array([state[:18] for state in states], dtype=np.int64).reshape(n, 18)
+    big = np.array([state[18:20] for state in states], dtype=np.int64).reshape(n, 2)
+    constraint = np.array([-1 if state[20] is None else 3 * state[20] + state[21] for state in states],
+                          dtype=np.int64)
+    player = np.array([state[22] for state in states], dtype=np.int64)
+    return marks, big, constraint, player
+
+
+def unpack_state(marks, big, constraint, player, i):
+    """ Reads game i of packed arrays back as a state tuple. """
+    c = int(constraint[i])
+    position = (None, None) if c < 0 else divmod(c, 3)
+    return tuple(int(m) for m in marks[i]) + (int(big[i, 0]), int(big[i, 1])) + position + (int(player[i]),)
+
+
+def ended(big):
+    """ Which games are over, from their (n, 2) won or full sub-boards. """
+    p1 = big[:, 0] & ~big[:, 1]
+    p2 = big[:, 1] & ~big[:, 0]
+    return win_array[p1] | win_array[p2] | full_array[big[:, 0] | big[:, 1]]
+
+
+def win_values(big):
+    """ (n, 2) win values of players 1 and 2, as Board.win_values gives them: 1, 0 or 0.5 each. """
+    p1 = win_array[big[:, 0] & ~big[:, 1]]
+    p2 = win_array[big[:, 1] & ~big[:, 0]]
+    values = np.full((len(big), 2), 0.5)
+    values[p1] = (1, 0)
+    values[p2] = (0, 1)
+    return values
+
+
+def random_moves(marks, big, constraint, player, rng):
+    """ Plays one uniformly random legal move in every game, in place.
+
+    Games must not be over. A move is drawn by counting the free cells of the
+    sub-boards each game may play in, picking one index below the total, and
+    finding its sub-board by the running counts and its cell with the select table.
+
+    Args:
+        marks, big, constraint, player:     Packed games (see pack_states).
+        rng:                                A numpy random Generator.
+
+    Returns:    The (n,) action ids played, 9 * sub-board + cell (see p2_t3.action_tuples).
+
+    """
+    n = len(player)
+    rows = np.arange(n)
+    occupied = marks[:, 0::2] | marks[:, 1::2]
+    finished = big[:, 0] | big[:, 1]
+    allowed = ((finished[:, None] >> _boards) & 1) == 0
+    allowed &= (constraint[:, None] < 0) | (constraint[:, None] == _boards)
+    free = np.where(allowed, ~occupied & 0x1ff, 0)
+
+    counts = popcount_array[free]
+    running = counts.cumsum(axis=1)
+    pick = (rng.random(n) * running[:, -1]).astype(np.int64)
+    board = (running <= pick[:, None]).sum(axis=1)
+    cell = select_array[free[rows, board], pick - running[rows, board] + counts[rows, board]]
+
+    bit = np.left_shift(1, cell)
+    index = 2 * board + player - 1
+    marks[rows, index] |= bit
+    won = win_array[marks[rows, index]]
+    full = full_array[occupied[rows, board] | bit] & ~won
+    square = np.left_shift(1, board)
+    big[rows, player - 1] |= np.where(won, square, 0)
+    big[full] |= square[full, None]
+
+    constraint[:] = np.where((big[:, 0] | big[:, 1]) & bit, -1, cell)
+    player[:] = 3 - player
+    return 9 * board + cell
+
+
+def batch_rollout(states, rng=None):
+    """ Plays out every state to the end with uniformly random moves, all games in lockstep.
+
+    This is mcts_vanilla.rollout for many states at once. Finished games drop
+    out of the arrays, so each step only works on the games still running.
+
+    Args:
+        states:     A sequence of state tuples (the same state may repeat).
+        rng:        A numpy random Generator, or None for a fresh one.
+
+    Returns:    An (n, 2) array of the win values of players 1 and 2 for each game.
+
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    marks, big, constraint, player = pack_states(states)
+    values = np.zeros((len(states), 2))
+    games = np.arange(len(states))
+
+    while len(games):
+        over = ended(big)
+        if over.any():
+            values[games[over]] = win_values(big[over])
+            running = ~over
+            games, marks, big, constraint, player = (
+                games[running], marks[running], big[running], constraint[running], player[running])
+            if not len(games):
+                break
+        random_moves(marks, big, constraint, player, rng)
+
+    return values
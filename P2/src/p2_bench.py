@@ -0,0 +1,291 @@
+import random
+import sys
+from timeit import default_timer as time
+
+import numpy as np
+
+import p2_t3
+import p2_batch
+import mcts_parallel
+import mcts_vanilla
+from p2_t3 import positions
+
+
+class TupleRolloutState(object):
+    """ The interface of p2_t3.RolloutState over tuple states: every move builds a new state with next_state. """
+
+    __slots__ = ('board', 'state', 'history')
+
+    def __init__(self, board, state):
+        self.board = board
+        self.state = state
+        self.history = []
+
+    def apply(self, action):
+        self.history.append(self.state)
+        self.state = self.board.next_state(self.state, action)
+
+    def undo(self):
+        self.state = self.history.pop()
+
+    def legal_actions(self):
+        return self.board.legal_actions(self.state)
+
+    def current_player(self):
+        return self.board.current_player(self.state)
+
+    def is_ended(self):
+        return self.board.is_ended(self.state)
+
+    def win_values(self):
+        return self.board.win_values(self.state)
+
+
+class TupleBoard(p2_t3.Board):
+    """ The table-driven board, with playouts on tuple states as before RolloutState. """
+
+    def rollout_state(self, state):
+        return TupleRolloutState(self, state)
+
+
+class LoopBoard(TupleBoard):
+    """ The board as it was before the lookup tables, for comparison: every check loops over the win masks. """
+
+    def next_state(self, state, action):
+        R, C, r, c = action
+        player = state[-1]
+        board_index = 2 * (3 * R + C)
+        player_index = player - 1
+
+        state = list(state)
+        state[-1] = 3 - player
+        state[board_index + player_index] |= positions[(r, c)]
+        updated_board = state[board_index + player_index]
+
+        full = (state[board_index] | state[board_index + 1] == 0x1ff)
+        if any(updated_board & w == w for w in self.wins):
+            state[18 + player_index] |= positions[(R, C)]
+        elif full:
+            state[18] |= positions[(R, C)]
+            state[19] |= positions[(R, C)]
+
+        if (state[18] | state[19]) & positions[(r, c)]:
+            state[20], state[21] = None, None
+        else:
+            state[20], state[21] = r, c
+
+        return tuple(state)
+
+    def legal_actions(self, state):
+        R, C = state[20], state[21]
+        Rset, Cset = (R,), (C,)
+        if R is None:
+            Rset, Cset = range(3), range(3)
+
+        occupied = [
+            state[2 * x] | state[2 * x + 1] for x in range(9)
+        ]
+        finished = state[18] | state[19]
+
+        return [
+            (R, C, r, c)
+            for R in Rset
+            for C in Cset
+            for r in range(3)
+            for c in range(3)
+            if not occupied[3 * R + C] & positions[(r, c)]
+            and not finished & positions[(R, C)]
+        ]
+
+    def is_ended(self, state):
+        p1 = state[18] & ~state[19]
+        p2 = state[19] & ~state[18]
+
+        if any(w & p1 == w for w in self.wins):
+            return True
+        if any(w & p2 == w for w in self.wins):
+            return True
+        return state[18] | state[19] == 0x1ff
+
+    def win_values(self, state):
+        if not self.is_ended(state):
+            return
+        p1 = state[18] & ~state[19]
+        p2 = state[19] & ~state[18]
+
+        if any(w & p1 == w for w in self.wins):
+            return {1: 1, 2: 0}
+        if any(w & p2 == w for w in self.wins):
+            return {1: 0, 2: 1}
+        if state[18] | state[19] == 0x1ff:
+            return {1: 0.5, 2: 0.5}
+
+
+def benchmark_playouts(board, count=2000, seed=0):
+    """ Times random playouts (mcts_vanilla.rollout) from the starting state.
+
+    Args:
+        board:  The game setup.
+        count:  Number of playouts.
+        seed:   Seed for the random moves.
+
+    Returns:    A dict with the playouts per second and the wins of each player.
+
+    """
+    random.seed(seed)
+    state = board.starting_state()
+    wins = {1: 0, 2: 0}
+    start = time()
+    for _ in range(count):
+        values = mcts_vanilla.rollout(board, state)
+        for player in wins:
+            wins[player] += values[player]
+    elapsed = time() - start
+    return {"playouts": count, "time": elapsed, "per_second": count / elapsed, "wins": wins}
+
+
+def benchmark_think(board, moves=3, seed=0):
+    """ Times mcts_vanilla.think (mcts_vanilla.num_nodes iterations) on the opening position.
+
+    Args:
+        board:  The game setup.
+        moves:  Number of think() calls.
+        seed:   Seed for the random moves.
+
+    Returns:    A dict with the mean seconds per move and the iterations per second.
+
+    """
+    random.seed(seed)
+    state = board.starting_state()
+    start = time()
+    for _ in range(moves):
+        mcts_vanilla.think(board, state)
+    elapsed = time() - start
+    return {"moves": moves, "per_move": elapsed / moves, "iterations_per_second": moves * mcts_vanilla.num_nodes / elapsed}
+
+
+def benchmark_batch(count=2000, batch=500, seed=0):
+    """ Times p2_batch.batch_rollout from the starting state, batch games at a time.
+
+    Args:
+        count:  Number of playouts.
+        batch:  Games played in lockstep per call.
+        seed:   Seed for the random moves.
+
+    Returns:    A dict with the playouts per second and the wins of each player.
+
+    """
+    rng = np.random.default_rng(seed)
+    state = p2_t3.Board().starting_state()
+    wins = np.zeros(2)
+    start = time()
+    for first in range(0, count, batch):
+        wins += p2_batch.batch_rollout([state] * min(batch, count - first), rng).sum(axis=0)
+    elapsed = time() - start
+    return {"playouts": count, "time": elapsed, "per_second": count / elapsed, "wins": {1: wins[0], 2: wins[1]}}
+
+
+def benchmark_tree_parallel(iterations=4000, leaves=256, seed=0):
+    """ Times mcts_vanilla.build_tree_batched (tree-parallel, virtual loss) on the opening position.
+
+    Args:
+        iterations:  Sampled games in the tree.
+        leaves:      Descents played out per batch.
+        seed:        Seed for the random moves.
+
+    Returns:    A dict with the seconds taken and the iterations per second.
+
+    """
+    random.seed(seed)
+    board = p2_t3.Board()
+    start = time()
+    mcts_vanilla.build_tree_batched(board, board.starting_state(), iterations, leaves=leaves)
+    elapsed = time() - start
+    return {"iterations": iterations, "time": elapsed, "iterations_per_second": iterations / elapsed}
+
+
+def benchmark_strength(games=10, seconds=0.5, workers=4, module=mcts_vanilla, seed=0):
+    """ Plays serial think() against root-parallel think() with the same wall-clock time per move.
+
+    Args:
+        games:    Number of games; the parallel bot moves first in every other one.
+        seconds:  Thinking time per move of both bots.
+        workers:  Worker processes of the parallel bot.
+        module:   The bot module both sides search with (mcts_vanilla or mcts_modified).
+        seed:     Seed for the serial bot and the parallel bot's trees.
+
+    Returns:    A dict with the parallel bot's wins, draws and losses and each bot's mean iterations per move.
+
+    """
+    random.seed(seed)
+    board = p2_t3.Board()
+
+    def serial(state):
+        statistics = module.root_statistics(module.build_tree(board, state, seconds=seconds))
+        return module.best_action(statistics), statistics
+
+    def parallel(state):
+        statistics = mcts_parallel.root_parallel(module.__name__, board, state, workers, seconds=seconds)
+        return module.best_action(statistics), statistics
+
+    results = {"wins": 0, "draws": 0, "losses": 0}
+    iterations = {"serial": [], "parallel": []}
+    for game in range(games):
+        players = {1: ("parallel", parallel), 2: ("serial", serial)}
+        if game % 2:
+            players = {1: players[2], 2: players[1]}
+        state = board.starting_state()
+        while not board.is_ended(state):
+            name, bot = players[board.current_player(state)]
+            action, statistics = bot(state)
+            iterations[name].append(sum(visits for wins, visits in statistics.values()))
+            state = board.next_state(state, action)
+        points = board.points_values(state)
+        parallel_player = 1 if players[1][0] == "parallel" else 2
+        if points[parallel_player] == 1:
+            results["wins"] += 1
+        elif points[3 - parallel_player] == 1:
+            results["losses"] += 1
+        else:
+            results["draws"] += 1
+
+    for name in iterations:
+        results[name + "_iterations"] = sum(iterations[name]) / len(iterations[name])
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'strength':
+        # python p2_bench.py strength [games] [seconds per move] [workers]
+        games = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+        seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+        workers = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+        result = benchmark_strength(games, seconds, workers)
+        print("root-parallel (%d workers) vs serial, %.2f s per move: %d wins, %d draws, %d losses" % (
+            workers, seconds, result["wins"], result["draws"], result["losses"]))
+        print("iterations per move: %.0f parallel, %.0f serial" % (
+            result["parallel_iterations"], result["serial_iterations"]))
+        mcts_parallel.close()
+        sys.exit(0)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    results = {}
+    boards = (("loops", LoopBoard()), ("tables", TupleBoard()), ("rollout_state", p2_t3.Board()))
+    for name, board in boards:
+        results[name] = benchmark_playouts(board, count)
+        think = benchmark_think(board)
+        print("%-14s %8.0f playouts/s (%5.2fx)  %7.3f s per think() move  %8.0f iterations/s" % (
+            name, results[name]["per_second"], results[name]["per_second"] / results["loops"]["per_second"],
+            think["per_move"], think["iterations_per_second"]))
+
+    for batch in (100, 1000, 10000):
+        result = benchmark_batch(max(count, batch), batch)
+        print("batch of %-5d %8.0f playouts/s (%5.2fx)" % (
+            batch, result["per_second"], result["per_second"] / results["loops"]["per_second"]))
+
+    serial = benchmark_think(p2_t3.Board())
+    for leaves in (64, 256, 1024):
+        result = benchmark_tree_parallel(4000, leaves)
+        print("tree, %-5d    %8.0f iterations/s (%5.2fx serial think())" % (
+            leaves, result["iterations_per_second"], result["iterations_per_second"] / serial["iterations_per_second"]))
@@ -30,17 +30,55 @@ inv_positions = dict(
     (v, P) for P, v in positions.items()
 )
 
+# Actions are (R, C, r, c): outer row and column, then inner row and column.
+# They also have an integer encoding 9 * (3 * R + C) + (3 * r + c), which
+# next_state and is_legal accept as well.
+action_tuples = tuple(
+    (R, C, r, c)
+    for R in range(3)
+    for C in range(3)
+    for r in range(3)
+    for c in range(3)
+)
+
+action_ids = dict((action, i) for i, action in enumerate(action_tuples))
+
+# (row, column) of each cell index 3 * r + c
+cell_positions = tuple((r, c) for r in range(3) for c in range(3))
+
+win_masks = [
+    positions[(r, 0)] | positions[(r, 1)] | positions[(r, 2)]
+    for r in range(3)
+] + [
+    positions[(0, c)] | positions[(1, c)] | positions[(2, c)]
+    for c in range(3)
+] + [
+    positions[(0, 0)] | positions[(1, 1)] | positions[(2, 2)],
+    positions[(0, 2)] | positions[(1, 1)] | positions[(2, 0)],
+]
+
+# Lookups over every 9-bit mask of a 3x3 board: whether it holds a line,
+# whether it is full, and its set cells in order
+win_table = tuple(any(m & w == w for w in win_masks) for m in range(512))
+full_table = tuple(m == 0x1ff for m in range(512))
+cell_table = tuple(tuple(i for i in range(9) if m & (1 << i)) for m in range(512))
+
+# Legal actions of a sub-board by its mask of free cells, as tuples and as ids
+legal_table = tuple(
+    tuple(tuple(action_tuples[9 * b + i] for i in cell_table[m]) for m in range(512))
+    for b in range(9)
+)
+legal_id_table = tuple(
+    tuple(tuple(9 * b + i for i in cell_table[m]) for m in range(512))
+    for b in range(9)
+)
+
+# Sub-board and cell of each action id
+action_boards = tuple(i // 9 for i in range(81))
+action_cells = tuple(i % 9 for i in range(81))
+
 class Board(object):
-    wins = [
-        positions[(r, 0)] | positions[(r, 1)] | positions[(r, 2)]
-        for r in range(3)
-    ] + [
-        positions[(0, c)] | positions[(1, c)] | positions[(2, c)]
-        for c in range(3)
-    ] + [
-        positions[(0, 0)] | positions[(1, 1)] | positions[(2, 2)],
-        positions[(0, 2)] | positions[(1, 1)] | positions[(2, 0)],
-    ]
+    wins = win_masks
 
     def starting_state(self):
         # Each of the 9 pairs of player 1 and player 2 board bitmasks
@@ -175,6 +213,8 @@ class Board(object):
         return R, C, r, c
 
     def unpack_action(self, action):
+        if action.__class__ is int and 0 <= action < 81:
+            action = action_tuples[action]
         try:
             return '{0} {1} {2} {3}'.format(*action)
         except Exception:
@@ -184,31 +224,38 @@ class Board(object):
         return self.unpack_action(action)
 
     def next_state(self, state, action):
-        R, C, r, c = action
+        if action.__class__ is int:
+            board, cell = divmod(action, 9)
+        else:
+            R, C, r, c = action
+            board, cell = 3 * R + C, 3 * r + c
         player = state[-1]
-        board_index = 2 * (3 * R + C)
+        board_index = 2 * board
         player_index = player - 1
 
         state = list(state)
         state[-1] = 3 - player
-        state[board_index + player_index] |= positions[(r, c)]
-        updated_board = state[board_index + player_index]
+        updated_board = state[board_index + player_index] | (1 << cell)
+        state[board_index + player_index] = updated_board
 
-        full = (state[board_index] | state[board_index + 1] == 0x1ff)
-        if any(updated_board & w == w for w in self.wins):
-            state[18 + player_index] |= positions[(R, C)]
-        elif full:
-            state[18] |= positions[(R, C)]
-            state[19] |= positions[(R, C)]
+        if win_table[updated_board]:
+            state[18 + player_index] |= 1 << board
+        elif full_table[state[board_index] | state[board_index + 1]]:
+            state[18] |= 1 << board
+            state[19] |= 1 << board
 
-        if (state[18] | state[19]) & positions[(r, c)]:
+        if (state[18] | state[19]) & (1 << cell):
             state[20], state[21] = None, None
         else:
-            state[20], state[21] = r, c
+            state[20], state[21] = cell_positions[cell]
 
         return tuple(state)
 
     def is_legal(self, state, action):
+        if action.__class__ is int:
+            if not 0 <= action < 81:
+                return False
+            action = action_tuples[action]
         R, C, r, c = action
 
         # Is action out of bounds?
@@ -239,26 +286,24 @@ class Board(object):
         return (R, C) == (state[20], state[21])
 
     def legal_actions(self, state):
-        R, C = state[20], state[21]
-        Rset, Cset = (R,), (C,)
-        if R is None:
-            Rset, Cset = range(3), range(3)
-
-        occupied = [
-            state[2 * x] | state[2 * x + 1] for x in range(9)
-        ]
-        finished = state[18] | state[19]
+        return self._legal(state, legal_table)
 
-        actions = [
-            (R, C, r, c)
-            for R in Rset
-            for C in Cset
-            for r in range(3)
-            for c in range(3)
-            if not occupied[3 * R + C] & positions[(r, c)]
-            and not finished & positions[(R, C)]
-        ]
+    def legal_action_ids(self, state):
+        # Same actions as legal_actions, in the same order, as integers
+        return self._legal(state, legal_id_table)
 
+    def _legal(self, state, table):
+        finished = state[18] | state[19]
+        if state[20] is None:
+            boards = cell_table[~finished & 0x1ff]
+        else:
+            boards = (3 * state[20] + state[21],)
+
+        actions = []
+        for board in boards:
+            if not finished & (1 << board):
+                free = ~(state[2 * board] | state[2 * board + 1]) & 0x1ff
+                actions.extend(table[board][free])
         return actions
 
     def previous_player(self, state):
@@ -270,27 +315,17 @@ class Board(object):
     def is_ended(self, state):
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
-
-        if any(w & p1 == w for w in self.wins):
-            return True
-        if any(w & p2 == w for w in self.wins):
-            return True
-        if state[18] | state[19] == 0x1ff:
-            return True
-
-        return False
+        return win_table[p1] or win_table[p2] or full_table[state[18] | state[19]]
 
     def win_values(self, state):
-        if not self.is_ended(state):
-            return
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
 
-        if any(w & p1 == w for w in self.wins):
+        if win_table[p1]:
             return {1: 1, 2: 0}
-        if any(w & p2 == w for w in self.wins):
+        if win_table[p2]:
             return {1: 0, 2: 1}
-        if state[18] | state[19] == 0x1ff:
+        if full_table[state[18] | state[19]]:
             return {1: 0.5, 2: 0.5}
 
     def owned_boxes(self, state):
@@ -308,21 +343,144 @@ class Board(object):
         return ret
         
     def points_values(self, state):
-        if not self.is_ended(state):
-            return
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
 
-        if any(w & p1 == w for w in self.wins):
+        if win_table[p1]:
             return {1: 1, 2: -1}
-        if any(w & p2 == w for w in self.wins):
+        if win_table[p2]:
             return {1: -1, 2: 1}
-        if state[18] | state[19] == 0x1ff:
+        if full_table[state[18] | state[19]]:
             return {1: 0, 2: 0}
 
+    def rollout_state(self, state):
+        return RolloutState(state)
+
     def winner_message(self, winners):
         winners = sorted((v, k) for k, v in winners.items())
         value, winner = winners[-1]
         if value == 0.5:
             return "Draw."
         return "Winner: Player {0}.".format(winner)
+
+
+class RolloutState(object):
+    """ A mutable game state for playouts: apply(action) and undo() change it in place.
+
+    It holds the same information as the tuple states of Board, with the
+    occupied cells of each sub-board and the finished sub-boards kept up to
+    date move by move, so a playout allocates no new state per move. The
+    tuple stays the external format: build one from a state tuple and read
+    it back with to_state().
+    """
+
+    __slots__ = ('marks', 'occupied', 'big', 'constraint', 'player', 'history', 'depth')
+
+    def __init__(self, state=None):
+        self.marks = [0] * 18      # Board bitmasks: 2 * sub-board + player - 1
+        self.occupied = [0] * 9    # Cells taken in each sub-board
+        self.big = [0, 0]          # Sub-boards won (or full, in both) for p1 and p2, like state[18:20]
+        self.history = [0] * 81    # Undo records, one per applied move
+        self.reset(state if state is not None else (0, 0) * 10 + (None, None, 1))
+
+    def reset(self, state):
+        """ Sets this object to the given state tuple, forgetting the undo history. """
+        for i in range(18):
+            self.marks[i] = state[i]
+        for b in range(9):
+            self.occupied[b] = state[2 * b] | state[2 * b + 1]
+        self.big[0], self.big[1] = state[18], state[19]
+        self.constraint = -1 if state[20] is None else 3 * state[20] + state[21]
+        self.player = state[22]
+        self.depth = 0
+        return self
+
+    def to_state(self):
+        if self.constraint < 0:
+            constraint = (None, None)
+        else:
+            constraint = cell_positions[self.constraint]
+        return tuple(self.marks) + (self.big[0], self.big[1]) + constraint + (self.player,)
+
+    def apply(self, action):
+        """ Plays an action (an id or an (R, C, r, c) tuple) for the player to move. """
+        if action.__class__ is not int:
+            action = action_ids[action]
+        board, cell = action_boards[action], action_cells[action]
+        player = self.player
+        big = self.big
+
+        bit = 1 << cell
+        mark = self.marks[2 * board + player - 1] | bit
+        self.marks[2 * board + player - 1] = mark
+        occupied = self.occupied[board] | bit
+        self.occupied[board] = occupied
+
+        # 1 if the move won its sub-board, 2 if it filled it
+        closed = 0
+        if win_table[mark]:
+            big[player - 1] |= 1 << board
+            closed = 1
+        elif full_table[occupied]:
+            big[0] |= 1 << board
+            big[1] |= 1 << board
+            closed = 2
+
+        self.history[self.depth] = action | (self.constraint + 1) << 7 | closed << 11
+        self.depth += 1
+        self.constraint = -1 if (big[0] | big[1]) & bit else cell
+        self.player = 3 - player
+
+    def undo(self):
+        """ Takes back the last applied move. """
+        self.depth -= 1
+        record = self.history[self.depth]
+        action = record & 127
+        board, cell = action_boards[action], action_cells[action]
+        player = 3 - self.player
+
+        self.player = player
+        self.constraint = ((record >> 7) & 15) - 1
+        keep = ~(1 << cell)
+        self.marks[2 * board + player - 1] &= keep
+        self.occupied[board] &= keep
+
+        closed = record >> 11
+        if closed:
+            keep = ~(1 << board)
+            if closed == 1:
+                self.big[player - 1] &= keep
+            else:
+                self.big[0] &= keep
+                self.big[1] &= keep
+
+    def legal_actions(self):
+        """ The legal action ids, in the same order as Board.legal_actions. """
+        finished = self.big[0] | self.big[1]
+        if self.constraint >= 0:
+            board = self.constraint
+            return list(legal_id_table[board][~self.occupied[board] & 0x1ff])
+
+        actions = []
+        for board in cell_table[~finished & 0x1ff]:
+            actions.extend(legal_id_table[board][~self.occupied[board] & 0x1ff])
+        return actions
+
+    def current_player(self):
+        return self.player
+
+    def is_ended(self):
+        p1 = self.big[0] & ~self.big[1]
+        p2 = self.big[1] & ~self.big[0]
+        return win_table[p1] or win_table[p2] or full_table[self.big[0] | self.big[1]]
+
+    def win_values(self):
+        p1 = self.big[0] & ~self.big[1]
+        p2 = self.big[1] & ~self.big[0]
+
+        if win_table[p1]:
+            return {1: 1, 2: 0}
+        if win_table[p2]:
+            return {1: 0, 2: 1}
+        if full_table[self.big[0] | self.big[1]]:
+            return {1: 0.5, 2: 0.5}